@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+Generates synthetic per-sample metric files for benchmarking load-metrics and
+create-report, along with matching metric and report definitions.
+"""
+
+import os
+import sys
+import random
+import argparse
+
+PicardHeader = """## htsjdk.samtools.metrics.StringHeader
+# picard.analysis.{tool} INPUT={sample}.bam OUTPUT={sample}
+## htsjdk.samtools.metrics.StringHeader
+# Started on: Thu Jan 01 00:00:00 UTC 2020
+
+## METRICS CLASS\tpicard.analysis.{metric_class}
+"""
+
+def picard_table(rng, sample, index, num_categories, num_metrics, histogram_length):
+    """ A Picard metric file with one row per category and an optional histogram. """
+    header = ["CATEGORY"] + [f"METRIC_{i}" for i in range(num_metrics)] + ["SAMPLE", "LIBRARY"]
+    lines  = [PicardHeader.format(tool=f"CollectMetrics{index}", sample=sample, metric_class=f"Metrics{index}").rstrip("\n")]
+    lines.append("\t".join(header))
+    for category in range(num_categories):
+        values = [str(rng.randint(0, 1000000)) if i % 2 == 0 else f"{rng.random():.6f}" for i in range(num_metrics)]
+        lines.append("\t".join([f"CAT_{category}"] + values + [sample, ""]))
+    lines.append("")
+    if histogram_length > 0:
+        lines.append("## HISTOGRAM\tjava.lang.Integer")
+        lines.append("insert_size\tAll_Reads.fr_count")
+        for i in range(histogram_length):
+            lines.append(f"{i}\t{rng.randint(0, 10000)}")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+def fgbio_table(rng, num_metrics):
+    """ An fgbio-style metric file: a header row and one row of values. """
+    header = [f"metric_{i}" for i in range(num_metrics)]
+    values = [str(rng.randint(0, 1000)) if i % 3 else f"{rng.random():.4f}" for i in range(num_metrics)]
+    return "\t".join(header) + "\n" + "\t".join(values) + "\n"
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--output-dir', help='The directory in which to write the metric files and definitions.', required=True)
+    parser.add_argument('--samples', help='The number of samples.', type=int, default=96)
+    parser.add_argument('--definitions', help='The number of Picard metric definitions.', type=int, default=8)
+    parser.add_argument('--categories', help='The number of categories per Picard metric file.', type=int, default=3)
+    parser.add_argument('--metrics', help='The number of metrics per row.', type=int, default=20)
+    parser.add_argument('--histogram-length', help='The number of rows in each Picard histogram (0 for none).', type=int, default=500)
+    parser.add_argument('--seed', help='The random seed.', type=int, default=42)
+    args = parser.parse_args(args=args)
+
+    rng     = random.Random(args.seed)
+    samples = [f"Sample{i:05d}" for i in range(args.samples)]
+    os.makedirs(args.output_dir, exist_ok=True)
+    metrics_dir = os.path.join(args.output_dir, "metrics")
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    # The metric and report definitions
+    with open(os.path.join(args.output_dir, "metric_defs.csv"), "w") as fh:
+        for i in range(args.definitions):
+            fh.write(f"Picard Metrics {i},.picard_metrics_{i}.txt,http://example.com/picard#{i},CATEGORY\n")
+        fh.write("Fgbio Metrics,.fgbio_metrics.txt,http://example.com/fgbio,\n")
+        fh.write("Tabular Metrics,.tabular_metrics.txt,http://example.com/tabular,\n")
+        fh.write("Sample Barcode Metrics,.demux_barcode_metrics.txt,http://example.com/demux,\n")
+    with open(os.path.join(args.output_dir, "report_defs.csv"), "w") as fh:
+        for i in range(args.definitions):
+            fh.write(f"Picard Metrics {i},CAT_0,metric_0,Picard {i} Metric 0\n")
+            fh.write(f"Picard Metrics {i},*,metric_1,Picard {i} Metric 1\n")
+        fh.write("Fgbio Metrics,None,metric_1,Fgbio Metric 1\n")
+        fh.write("Tabular Metrics,None,metric_2,Tabular Metric 2\n")
+
+    # The DemuxFastqs metrics, used to infer the sample names
+    with open(os.path.join(args.output_dir, "demux_barcode_metrics.txt"), "w") as fh:
+        fh.write("barcode_name\tlibrary_name\tbarcode\ttemplates\tpairs\n")
+        for i in range(args.samples):
+            fh.write(f"Sample{i:05d}\tLib\tACGT\t{rng.randint(0, 1000000)}\t{rng.randint(0, 1000000)}\n")
+        fh.write(f"unmatched\tunmatched\tNNNN\t{rng.randint(0, 1000)}\t0\n")
+
+    # The per-sample metric files
+    for sample in samples:
+        sample_name = f"{sample}-Lib-ACGT"
+        for i in range(args.definitions):
+            with open(os.path.join(metrics_dir, f"{sample_name}.picard_metrics_{i}.txt"), "w") as fh:
+                fh.write(picard_table(rng, sample_name, i, args.categories, args.metrics, args.histogram_length if i == 0 else 0))
+        with open(os.path.join(metrics_dir, f"{sample_name}.fgbio_metrics.txt"), "w") as fh:
+            fh.write(fgbio_table(rng, args.metrics))
+        with open(os.path.join(metrics_dir, f"{sample_name}.tabular_metrics.txt"), "w") as fh:
+            fh.write(fgbio_table(rng, args.metrics))
+        with open(os.path.join(metrics_dir, f"{sample_name}.demux_barcode_metrics.txt"), "w") as fh:
+            fh.write("barcode_name\tlibrary_name\tbarcode\ttemplates\n")
+            for barcode_name, barcode in [("S1", "ACGT"), ("S2", "TGCA")]:
+                fh.write(f"{barcode_name}\tLib\t{barcode}\t{rng.randint(0, 1000000)}\n")
+
+    sys.stderr.write(f"Wrote {args.samples * (args.definitions + 3)} metric files to {metrics_dir}\n")
+
+if __name__ == "__main__":
+    main()
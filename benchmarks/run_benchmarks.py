@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""
+Times load-metrics, create-report, the metric file parsers, and the output
+writers over synthetic data produced by generate_data.py, records throughput
+and peak memory to a JSON file, and optionally compares against a baseline.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import contextlib
+from collections import OrderedDict
+
+from bfx_qc_reporter.__main__ import main as bfx_qc_reporter_main
+from bfx_qc_reporter import load_metrics
+from bfx_qc_reporter.util.json_io import read_json_samples, write_json_samples
+from bfx_qc_reporter.util.matrix import MetricMatrix
+from bfx_qc_reporter.create_report import read_report_defs, write_report
+
+@contextlib.contextmanager
+def quiet():
+    """ Silences writes to stderr. """
+    stderr = sys.stderr
+    with open(os.devnull, "w") as fh:
+        sys.stderr = fh
+        try:
+            yield
+        finally:
+            sys.stderr = stderr
+
+def measure(func, repeat, memory):
+    """
+    Runs the function repeat times, returning the best wall time and CPU time in
+    seconds, and the peak memory in bytes from one extra run under tracemalloc.
+    """
+    wall, cpu = None, None
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        with quiet():
+            func()
+        wall_elapsed, cpu_elapsed = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        wall = wall_elapsed if wall is None else min(wall, wall_elapsed)
+        cpu  = cpu_elapsed if cpu is None else min(cpu, cpu_elapsed)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        with quiet():
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return wall, cpu, peak
+
+def check_categories(metric_data):
+    """
+    Checks that every sample has the same categories for each metric group, as
+    generate_data.py writes the same categories for every sample (ex. one per
+    barcode name for the per-sample DemuxFastqs metrics).
+    """
+    errors     = []
+    categories = OrderedDict()
+    for sample_name in metric_data.sample_names:
+        for group, group_data in metric_data.sample_dict(sample_name).items():
+            sample_categories = list(group_data.keys())
+            expected          = categories.setdefault(group, sample_categories)
+            if sample_categories != expected:
+                errors.append(f"{group}: {sample_name} has categories {sample_categories}, expected {expected}")
+    for error in errors:
+        sys.stderr.write(f"Error: {error}\n")
+    if errors:
+        sys.exit(1)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--data-dir', help='The directory written by generate_data.py.', required=True)
+    parser.add_argument('--work-dir', help='The directory in which to write outputs.', required=True)
+    parser.add_argument('--output', help='The path to the JSON results file.', required=True)
+    parser.add_argument('--baseline', help='The path to a JSON results file to compare against.', required=False)
+    parser.add_argument('--threshold', help='The fraction by which a benchmark may be slower (or use more memory) than the baseline.', type=float, default=0.2)
+    parser.add_argument('--repeat', help='The number of times to run each benchmark (the best time is kept).', type=int, default=3)
+    parser.add_argument('--threads', help='The number of threads for the parallel load-metrics benchmark.', type=int, default=4)
+    parser.add_argument('--no-memory', help='Do not measure peak memory.', action='store_true', default=False)
+    args = parser.parse_args(args=args)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    metrics_dir  = os.path.join(args.data_dir, "metrics")
+    metric_defs  = os.path.join(args.data_dir, "metric_defs.csv")
+    report_defs  = os.path.join(args.data_dir, "report_defs.csv")
+    demux        = os.path.join(args.data_dir, "demux_barcode_metrics.txt")
+    prefix       = os.path.join(args.work_dir, "metrics")
+    report       = os.path.join(args.work_dir, "report")
+    load_args    = ["load-metrics", "--output-dir", metrics_dir, "--output-prefix", prefix,
+                    "--metric-defs", metric_defs, "--demux-barcode-metrics", demux]
+    metric_files = [os.path.join(metrics_dir, fn) for fn in sorted(os.listdir(metrics_dir))]
+    num_files    = len(metric_files)
+    num_bytes    = sum(os.path.getsize(path) for path in metric_files)
+
+    # Produce the inputs for the create-report and writer benchmarks
+    with quiet():
+        bfx_qc_reporter_main(load_args)
+    metric_data = MetricMatrix.from_samples(read_json_samples(prefix + ".json"))
+    check_categories(metric_data)
+    num_samples = len(metric_data.sample_names)
+    categories  = dict((path, None) for path in metric_files)
+
+    def write_json():
+        with open(prefix + ".bench.json", "w") as fh:
+            write_json_samples(fh, ((name, metric_data.sample_dict(name)) for name in metric_data.sample_names))
+
+    benchmarks = OrderedDict([
+        ("load_metrics", (lambda: bfx_qc_reporter_main(load_args), num_files, "files")),
+        ("load_metrics_threads", (lambda: bfx_qc_reporter_main(load_args + ["--threads", str(args.threads)]), num_files, "files")),
+        ("create_report", (lambda: bfx_qc_reporter_main(["create-report", "--input", prefix + ".json", "--output-prefix", report, "--report-defs", report_defs]), num_samples, "samples")),
+        ("parse_metric_files", (lambda: [load_metrics.to_metric_dict(path, ["category"] if ".picard_" in path else None) for path in metric_files], num_files, "files")),
+        ("read_json", (lambda: MetricMatrix.from_samples(read_json_samples(prefix + ".json")), num_samples, "samples")),
+        ("write_json", (write_json, num_samples, "samples")),
+        ("write_report", (lambda: write_report(metric_data, read_report_defs(report_defs), report), num_samples, "samples")),
+    ])
+
+    results = OrderedDict([
+        ("python", sys.version.split()[0]),
+        ("samples", num_samples),
+        ("files", num_files),
+        ("bytes", num_bytes),
+        ("benchmarks", OrderedDict()),
+    ])
+    for name, (func, count, unit) in benchmarks.items():
+        wall, cpu, peak = measure(func, repeat=args.repeat, memory=not args.no_memory)
+        results["benchmarks"][name] = OrderedDict([
+            ("wall_seconds", wall),
+            ("cpu_seconds", cpu),
+            ("throughput", count / wall if wall > 0 else None),
+            ("throughput_unit", f"{unit}/s"),
+            ("peak_memory_bytes", peak),
+        ])
+        peak_str = f", peak {peak / (1024 * 1024):.1f}MB" if peak is not None else ""
+        sys.stderr.write(f"{name}: {wall:.3f}s wall, {cpu:.3f}s cpu, {count / wall:.1f} {unit}/s{peak_str}\n")
+
+    with open(args.output, "w") as fh:
+        fh.write(json.dumps(results, indent=4) + "\n")
+
+    # Compare against the baseline
+    if args.baseline:
+        with open(args.baseline, "r") as fh:
+            baseline = json.load(fh)
+        regressions = []
+        for name, result in results["benchmarks"].items():
+            if name not in baseline["benchmarks"]:
+                continue
+            for key in ["wall_seconds", "peak_memory_bytes"]:
+                value, base = result[key], baseline["benchmarks"][name][key]
+                if value is not None and base and value > base * (1 + args.threshold):
+                    regressions.append(f"{name} {key}: {value:.4g} vs baseline {base:.4g} (+{100 * (value / base - 1):.1f}%)")
+        for regression in regressions:
+            sys.stderr.write(f"Regression: {regression}\n")
+        if regressions:
+            sys.exit(1)
+        sys.stderr.write(f"No regressions beyond {100 * args.threshold:.0f}% of the baseline\n")
+
+if __name__ == "__main__":
+    main()
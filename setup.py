@@ -11,6 +11,11 @@ setup(
     packages = ["bfx_qc_reporter", "bfx_qc_reporter.util"],
     package_dir = {"bfx_qc_reporter" : "src/python/bfx_qc_reporter", "bfx_qc_reporter.util" : "src/python/bfx_qc_reporter/util"},
     package_data = {"bfx_qc_reporter" : ["src/python/bfx_qc_reporter/resources/*.csv"]},
+    data_files = [
+        ("share/bfx-qc-reporter/html", ["src/html/index.html"]),
+        ("share/bfx-qc-reporter/html/css", ["src/html/css/my.css"]),
+        ("share/bfx-qc-reporter/html/js", ["src/html/js/my.js"]),
+    ],
     install_requires = [],
     classifiers = [
         "Development Status :: 3 - Alpha",
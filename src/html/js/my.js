@@ -390,6 +390,50 @@
 		return sampleJson
 	}
 	
+	/**
+	 * Parses the given metric JSON text.  The output of load-metrics may have NaN,
+	 * Infinity, and -Infinity tokens for non-finite values, which JSON.parse rejects,
+	 * so these are read as the strings "NaN", "Infinity", and "-Infinity".
+	 */
+	function parseMetricJson(text) {
+		try {
+			return JSON.parse(text);
+		}
+		catch (error) {
+			var quoted = text.replace(/"(?:[^"\\]|\\.)*"|-?Infinity|NaN/g, function(token) {
+				return (token.charAt(0) == '"') ? token : '"' + token + '"';
+			});
+			if (quoted == text) throw error;
+			return JSON.parse(quoted);
+		}
+	}
+
+	/**
+	 * Loads and displays the given metric JSON text.
+	 */
+	function loadJsonMetricData(jsonMetricData) {
+		// Load in the JSON data
+		try { 
+			if (jsonMetricData.length == 0) return alert("No JSON data given.");
+			var json = parseMetricJson(jsonMetricData);
+		}     
+		catch (error) {
+			return alert("Cannot parse JSON: " + error);
+		}   
+
+		// Get the JSON for the first sample
+		sampleJson = getSampleJson(json);
+
+		// Load the metric definitions from the first sample
+		$('#json-metric-defs-renderer').jsonMetricDefs(sampleJson);
+
+		// Load the metric data
+		$('#json-metric-data-renderer').jsonMetricData(json, sampleJson);
+
+		// Show the main div
+		$('.content').css('display', 'inline-block');
+	}
+
 	$("#json-metric-data").change(function() {
 		if (!browserSupportFileUpload()) {
 			alert('The File APIs are not fully supported in this browser!');
@@ -399,33 +443,338 @@
 			var reader = new FileReader();
 			reader.readAsText(file);
 			reader.onload = function(event) {
-				var jsonMetricData = event.target.result;
+				loadJsonMetricData(event.target.result);
+			};
+			reader.onerror = function() {
+				alert('Unable to read ' + file.fileName);
+			};
+		}
+	});
 
-				// Load in the JSON data
-				try { 
-					if (jsonMetricData.length == 0) return alert("No JSON data given.");
-					var json = eval('(' + jsonMetricData + ')');
-				}     
-				catch (error) {
-					return alert("Cannot eval JSON: " + error);
-				}   
+	/**
+	 * When served by the "serve" command, load the metrics from the server, and
+	 * reload them whenever their version changes.
+	 */
+	var servedMetricsVersion = null;
+	function pollServedMetrics() {
+		$.get('metrics.version', function(version) {
+			if (version !== servedMetricsVersion) {
+				servedMetricsVersion = version;
+				$.get('metrics.json', function(text) {
+					loadJsonMetricData(text);
+				}, 'text');
+			}
+			setTimeout(pollServedMetrics, 5000);
+		}, 'text');
+	}
+	if (window.location.protocol.startsWith('http')) {
+		pollServedMetrics();
+	}
 
-				// Get the JSON for the first sample
-				sampleJson = getSampleJson(json);
+	/**
+	 * Reads a single histogram from the binary histogram file, using the histogram index
+	 * to read only the bytes for the given sample and metric group.  Calls the callback
+	 * with a map from column name to a Float64Array of values.
+	 */
+	function readHistogram(index, binFile, sampleKey, groupKey, callback) {
+		if (!index.hasOwnProperty(sampleKey) || !index[sampleKey].hasOwnProperty(groupKey)) {
+			return callback(null);
+		}
+		var entry = index[sampleKey][groupKey];
+		var numBytes = entry.length * entry.columns.length * 8;
+		var reader = new FileReader();
+		reader.onload = function(event) {
+			var view = new DataView(event.target.result);
+			var columns = {};
+			for (var i = 0; i < entry.columns.length; i++) {
+				var values = new Float64Array(entry.length);
+				for (var j = 0; j < entry.length; j++) {
+					values[j] = view.getFloat64((i * entry.length + j) * 8, true);
+				}
+				columns[entry.columns[i]] = values;
+			}
+			callback(columns);
+		};
+		reader.onerror = function() {
+			alert('Unable to read ' + binFile.name);
+		};
+		reader.readAsArrayBuffer(binFile.slice(entry.offset, entry.offset + numBytes));
+	}
+
+	/**
+	 * Draws the histogram as one line per column, using the first column as the x-axis.
+	 */
+	function drawHistogram(canvas, columns) {
+		var context = canvas.getContext('2d');
+		context.clearRect(0, 0, canvas.width, canvas.height);
+		if (columns == null) {
+			return;
+		}
+		var names = Object.keys(columns);
+		if (names.length < 2) {
+			return;
+		}
+		var xs = columns[names[0]];
+		var xMin = Math.min.apply(null, xs), xMax = Math.max.apply(null, xs);
+		var yMax = 0;
+		for (var i = 1; i < names.length; i++) {
+			yMax = Math.max(yMax, Math.max.apply(null, columns[names[i]]));
+		}
+		var colors = ['steelblue', 'darkorange', 'seagreen', 'firebrick', 'slateblue'];
+		for (var i = 1; i < names.length; i++) {
+			var ys = columns[names[i]];
+			context.strokeStyle = colors[(i - 1) % colors.length];
+			context.beginPath();
+			for (var j = 0; j < xs.length; j++) {
+				var x = (xMax > xMin) ? (xs[j] - xMin) / (xMax - xMin) * canvas.width : 0;
+				var y = canvas.height - ((yMax > 0) ? ys[j] / yMax * canvas.height : 0);
+				if (j == 0) context.moveTo(x, y);
+				else context.lineTo(x, y);
+			}
+			context.stroke();
+			context.fillStyle = context.strokeStyle;
+			context.fillText(names[i], 10, 15 * i);
+		}
+	}
+
+	var histogramIndex = null;
+	var histogramBinFile = null;
+
+	function showHistogram() {
+		var sampleKey = $('#histogram-sample').val();
+		var groupKey = $('#histogram-group').val();
+		readHistogram(histogramIndex, histogramBinFile, sampleKey, groupKey, function(columns) {
+			drawHistogram(document.getElementById('histogram-canvas'), columns);
+		});
+	}
 
-				// Load the metric definitions from the first sample
-				$('#json-metric-defs-renderer').jsonMetricDefs(sampleJson);
+	$("#histogram-files").change(function() {
+		var files = $("#histogram-files").prop('files');
+		var indexFile = null;
+		histogramBinFile = null;
+		for (var i = 0; i < files.length; i++) {
+			if (files[i].name.endsWith('.json')) indexFile = files[i];
+			else if (files[i].name.endsWith('.bin')) histogramBinFile = files[i];
+		}
+		if (indexFile == null || histogramBinFile == null) {
+			return alert('Select both the .histograms.json and .histograms.bin files.');
+		}
+		var reader = new FileReader();
+		reader.onload = function(event) {
+			try {
+				histogramIndex = JSON.parse(event.target.result);
+			}
+			catch (error) {
+				return alert("Cannot parse the histogram index: " + error);
+			}
+			var groups = {};
+			$('#histogram-sample').empty();
+			for (var sampleKey in histogramIndex) {
+				$('#histogram-sample').append($('<option>').val(sampleKey).text(sampleKey));
+				for (var groupKey in histogramIndex[sampleKey]) groups[groupKey] = true;
+			}
+			$('#histogram-group').empty();
+			for (var groupKey in groups) {
+				$('#histogram-group').append($('<option>').val(groupKey).text(groupKey));
+			}
+			showHistogram();
+		};
+		reader.readAsText(indexFile);
+	});
+
+	$('#histogram-sample, #histogram-group').change(showHistogram);
 
-				// Load the metric data
-				$('#json-metric-data-renderer').jsonMetricData(json, sampleJson);
+	/**
+	 * A virtual metric table over the data shards written by load-metrics or
+	 * create-report with --viewer.  Only the rows and columns on screen are drawn,
+	 * and only the shards (one per metric group and page of samples) they need are
+	 * read, so the table is interactive immediately for any number of samples.
+	 */
+	var viewer = {
+		manifest: null,
+		files: null,      // shard file name -> File, when the directory was chosen
+		baseUrl: null,    // the URL of the directory, when given in the page URL
+		shards: {},       // shard file name -> values, or null while it is read
+		groupRows: [],    // for each metric, its row within its group's shards
+		rowHeight: 22,
+		columnWidth: 110,
+		labelWidths: [170, 140, 190],
+		scheduled: false,
+		errorShown: false // whether an error reading the viewer data was shown
+	};
+
+	function escapeHtml(string) {
+		return String(string).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+	}
 
-				// Show the main div
-				$('.content').css('display', 'inline-block');
+	/**
+	 * Reads and parses a JSON file from the viewer directory, calling the callback
+	 * with null if it could not be read or parsed.  The first such error since the
+	 * viewer data was chosen is shown.
+	 */
+	function readViewerFile(name, callback) {
+		function failed(message) {
+			if (!viewer.errorShown) {
+				viewer.errorShown = true;
+				alert('Unable to read ' + name + ' from the viewer data: ' + message);
+			}
+			callback(null);
+		}
+		function parse(text) {
+			try {
+				var values = parseMetricJson(text);
+			}
+			catch (error) {
+				return failed(error);
+			}
+			callback(values);
+		}
+		if (viewer.files != null) {
+			var file = viewer.files[name];
+			if (file == null) {
+				return failed('no such file');
+			}
+			var reader = new FileReader();
+			reader.onload = function(event) {
+				parse(event.target.result);
 			};
 			reader.onerror = function() {
-				alert('Unable to read ' + file.fileName);
+				failed(reader.error);
 			};
+			reader.readAsText(file);
 		}
+		else {
+			$.get(viewer.baseUrl + '/' + name, parse, 'text').fail(function(xhr, status, error) {
+				failed(error || status);
+			});
+		}
+	}
+
+	/**
+	 * Returns the values in the shard for the given metric group and page of
+	 * samples, or null if it is not yet read, in which case it is read and the table
+	 * is drawn again once it has been.
+	 */
+	function viewerShard(groupIndex, page) {
+		var name = viewer.manifest.groups[groupIndex].pages[page];
+		if (!viewer.shards.hasOwnProperty(name)) {
+			viewer.shards[name] = null;
+			readViewerFile(name, function(values) {
+				viewer.shards[name] = values;
+				scheduleViewerRender();
+			});
+		}
+		return viewer.shards[name];
+	}
+
+	function formatViewerValue(value) {
+		if (value === null) {
+			return '<span class="json-literal">null</span>';
+		}
+		else if (typeof value === 'string') {
+			return '<span class="json-string">' + escapeHtml(value) + '</span>';
+		}
+		return '<span class="json-literal">' + value + '</span>';
+	}
+
+	function viewerCell(x, y, width, cls, content) {
+		return '<div class="viewer-cell ' + cls + '" style="left:' + x + 'px;top:' + y + 'px;width:' + width + 'px;height:' + viewer.rowHeight + 'px">' + content + '</div>';
+	}
+
+	/**
+	 * Draws the header, metric labels, and values for the rows and columns on screen.
+	 */
+	function renderViewer() {
+		viewer.scheduled = false;
+		var manifest = viewer.manifest;
+		if (manifest == null) {
+			return;
+		}
+		var scroller = document.getElementById('viewer-scroller');
+		var top = scroller.scrollTop, left = scroller.scrollLeft;
+		var width = scroller.clientWidth, height = scroller.clientHeight;
+		var rowHeight = viewer.rowHeight, columnWidth = viewer.columnWidth;
+		var labelWidth = viewer.labelWidths[0] + viewer.labelWidths[1] + viewer.labelWidths[2];
+		var firstRow = Math.floor(top / rowHeight);
+		var lastRow = Math.min(manifest.metrics.length, Math.ceil((top + height) / rowHeight));
+		var firstColumn = Math.floor(left / columnWidth);
+		var lastColumn = Math.min(manifest.sample_names.length, Math.ceil((left + width - labelWidth) / columnWidth));
+
+		var html = '';
+		for (var i = firstRow; i < lastRow; i++) {
+			var metric = manifest.metrics[i];
+			var y = rowHeight + i * rowHeight - top;
+			for (var j = firstColumn; j < lastColumn; j++) {
+				var page = Math.floor(j / manifest.page_size);
+				var values = viewerShard(metric[0], page);
+				var value = (values == null) ? '' : formatViewerValue(values[viewer.groupRows[i]][j - page * manifest.page_size]);
+				html += viewerCell(labelWidth + j * columnWidth - left, y, columnWidth, 'viewer-value', value);
+			}
+			var labels = [manifest.groups[metric[0]].name, metric[1], metric[2]];
+			for (var k = 0, x = 0; k < labels.length; x += viewer.labelWidths[k], k++) {
+				html += viewerCell(x, y, viewer.labelWidths[k], 'viewer-label', escapeHtml(labels[k]));
+			}
+		}
+		for (var j = firstColumn; j < lastColumn; j++) {
+			html += viewerCell(labelWidth + j * columnWidth - left, 0, columnWidth, 'viewer-header', escapeHtml(manifest.sample_names[j]));
+		}
+		var headers = ['Group', 'Category', 'Name'];
+		for (var k = 0, x = 0; k < headers.length; x += viewer.labelWidths[k], k++) {
+			html += viewerCell(x, 0, viewer.labelWidths[k], 'viewer-header viewer-label', headers[k]);
+		}
+		$('#viewer-window').css({top: top, left: left, width: width, height: height}).html(html);
+	}
+
+	function scheduleViewerRender() {
+		if (!viewer.scheduled) {
+			viewer.scheduled = true;
+			window.requestAnimationFrame(renderViewer);
+		}
+	}
+
+	/**
+	 * Shows the virtual table for the given manifest.
+	 */
+	function loadViewer(manifest) {
+		if (manifest == null) {
+			return; // the error was shown by readViewerFile
+		}
+		viewer.manifest = manifest;
+		viewer.shards = {};
+		viewer.groupRows = [];
+		var groupCounts = manifest.groups.map(function() { return 0; });
+		for (var i = 0; i < manifest.metrics.length; i++) {
+			viewer.groupRows.push(groupCounts[manifest.metrics[i][0]]++);
+		}
+		var labelWidth = viewer.labelWidths[0] + viewer.labelWidths[1] + viewer.labelWidths[2];
+		$('#viewer-spacer').css({
+			width: labelWidth + manifest.sample_names.length * viewer.columnWidth,
+			height: (manifest.metrics.length + 1) * viewer.rowHeight
+		});
+		$('#viewer-scroller').show();
+		scheduleViewerRender();
+	}
+
+	$('#viewer-scroller').on('scroll', scheduleViewerRender);
+	$(window).on('resize', scheduleViewerRender);
+
+	$("#viewer-files").change(function() {
+		var files = $("#viewer-files").prop('files');
+		viewer.files = {};
+		viewer.baseUrl = null;
+		for (var i = 0; i < files.length; i++) {
+			viewer.files[files[i].name] = files[i];
+		}
+		viewer.errorShown = false;
+		readViewerFile('manifest.json', loadViewer);
 	});
 
+	// When the page URL has "?viewer=<url>", read the data shards from that directory
+	var viewerParam = /[?&]viewer=([^&]+)/.exec(window.location.search);
+	if (viewerParam) {
+		viewer.baseUrl = decodeURIComponent(viewerParam[1]).replace(/\/$/, '');
+		viewer.errorShown = false;
+		readViewerFile('manifest.json', loadViewer);
+	}
+
 })(jQuery);
@@ -1,22 +1,37 @@
 import sys
 import argparse
+import importlib
 from bfx_qc_reporter.util.parser import *
-from bfx_qc_reporter import create_report
-from bfx_qc_reporter import load_metrics
+
+# The module for each subcommand.  Only the module for the subcommand being run is
+# imported, so that each run starts quickly.
+Subcommands = [
+    "cohort",
+    "compile_defs",
+    "create_report",
+    "discover",
+    "gather",
+    "load_metrics",
+    "load_report",
+    "load_sample",
+    "serve",
+]
 
 def main(args=None):
     """The main routine."""
-    
+
     parser = argparse.ArgumentParser(prog="bfx-qc-reporter")
 
     subparsers = parser.add_subparsers(dest="subcommand")
     subparsers.required = True
-    
-    # Add subparsers here
-    create_report.add_subparser(subparsers=subparsers)
-    load_metrics.add_subparser(subparsers=subparsers)
 
-    args = parser.parse_args(args=args)
+    # Add the subparser for the subcommand being run, or all of them (ex. for --help)
+    argv    = sys.argv[1:] if args is None else args
+    modules = [module for module in Subcommands if argv and argv[0] == module.replace("_", "-")] or Subcommands
+    for module in modules:
+        importlib.import_module(f"bfx_qc_reporter.{module}").add_subparser(subparsers=subparsers)
+
+    args = parser.parse_args(args=argv)
     args.func(parser, args)
 
 
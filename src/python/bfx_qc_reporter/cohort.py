@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import argparse
+from bfx_qc_reporter.util.parser import *
+from bfx_qc_reporter.util.json_io import read_json_samples
+from bfx_qc_reporter.util.store import is_store, read_store, append_run
+from bfx_qc_reporter.create_report import read_report_defs, write_report
+
+def add_subparser(subparsers):
+    description="""
+    Appends the output of load-metrics from many runs to a cohort store, and reports metrics across runs.
+
+    # The Cohort Store
+
+    The --cohort option specifies the path to the cohort store, a single-file
+    SQLite database.  It is created if it does not exist.
+
+    # Adding a Run
+
+    The --add option specifies the path to the output of load-metrics for a run
+    (JSON, newline-delimited JSON, or a metric store), and --run-name the unique
+    name of the run.  Each sample is stored as "<run-name>/<sample-name>".  The
+    samples are added one at a time, and the previously added runs are never read.
+    Adding a run with the same name again replaces the previous run, unless the
+    metrics are unchanged, in which case the cohort store is left as is.
+
+    # Reporting Across Runs
+
+    The --report-defs option specifies the path to the report definitions, in
+    the same format as create-report.  If --output-prefix is given, a report over
+    all samples in all runs is written as with create-report, where each sample is
+    named "<run-name>/<sample-name>".  Only the reported metrics are read from the
+    cohort store.
+
+    """
+
+    parser = build_subparser(subparsers, source_file=__file__, description=description)
+
+    script_dir = os.path.abspath(os.path.dirname(__file__))
+    parser.add_argument('--cohort', help='The path to the cohort store.', required=True)
+    parser.add_argument('--add', help='The path to the output of load-metrics for a run to add to the cohort store.', required=False)
+    parser.add_argument('--run-name', help='The unique name of the run to add.', required=False)
+    parser.add_argument('--output-prefix', help='The path prefix for the report output files', required=False)
+    parser.add_argument('--report-defs', help="The path to the report definitions.", required=False,
+            default=os.path.join(script_dir, "resources", "report_defs.csv"))
+    parser.add_argument('--transpose', help='Transpose the rows and columns.', required=False, action='store_true', default=False)
+    parser.set_defaults(func=main)
+
+    return parser
+
+def main(parser, args):
+
+    if not args.add and not args.output_prefix:
+        fail_parser(parser, "At least one of --add or --output-prefix must be given.")
+
+    # Add the run to the cohort store
+    if args.add:
+        if not args.run_name:
+            fail_parser(parser, "--run-name must be given with --add.")
+        if is_store(args.add):
+            run_data = read_store(args.add)
+            samples  = ((sample_name, run_data.sample_dict(sample_name)) for sample_name in run_data.sample_names)
+        else:
+            samples  = read_json_samples(args.add)
+        status = append_run(args.cohort, args.run_name, samples)
+        sys.stderr.write(f"Run {args.run_name} {status} in {args.cohort}\n")
+
+    # Report across all runs
+    if args.output_prefix:
+        report_defs = read_report_defs(args.report_defs)
+        metric_data = read_store(args.cohort, keys=[tuple(report_def[:3]) for report_def in report_defs])
+        write_report(metric_data, report_defs, args.output_prefix, transpose=args.transpose)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import argparse
+from bfx_qc_reporter.util.parser import *
+from bfx_qc_reporter.util.util import fail
+from bfx_qc_reporter.util.file_index import MetricFileIndex
+from bfx_qc_reporter.util.archive import is_archive
+from bfx_qc_reporter.load_metrics import read_metric_defs, write_defs_bundle, find_sample_names, infer_metric_types, \
+        DefsBundleExtension
+
+def add_subparser(subparsers):
+    description="""
+    Validates the metric definitions and transform scripts, and compiles them into a bundle.
+
+    # Compiling the Metric Definitions
+
+    The metric definitions (see load-metrics) are read and validated, and each
+    transform script is found and loaded to check that it has a 'transform' or
+    'transform_batch' method.  The definitions are then written to a bundle (a JSON
+    file) at --output, with the transform scripts resolved to absolute paths.  The
+    bundle may be given to --metric-defs of any command in place of the metric
+    definitions, and is read without re-validating the definitions or loading the
+    transform scripts.  Each transform script is only loaded once the metrics for its
+    metric group are transformed.  Re-run compile-defs if the metric definitions or
+    transform scripts change.
+
+    # Fixing the Metric Types
+
+    If --output-dir is given, the type of each metric is inferred as in load-metrics
+    from the metric files in the output directory, and stored in the bundle.  The
+    metric files are then parsed with these types, rather than inferring them again
+    on each run, so that every sample has the same types even when processed one at
+    a time (see load-sample).  The samples are given as in load-metrics.
+
+    """
+
+    parser = build_subparser(subparsers, source_file=__file__, description=description)
+
+    script_dir = os.path.abspath(os.path.dirname(__file__))
+    parser.add_argument('--metric-defs', help="The path to the metric definitions, comma-delimited.", required=False,
+            default=os.path.join(script_dir, "resources", "metric_defs.csv"))
+    parser.add_argument('--output', help=f"The path to which to write the bundle, ending with {DefsBundleExtension}.", required=True)
+    parser.add_argument('--output-dir', help='The path to a directory or archive of metric files from which to infer the metric types.', required=False, default=None)
+    parser.add_argument('--sample-names', help="The sample names used to find the metric files in --output-dir.", required=False, default=[], nargs='+')
+    parser.add_argument('--demux-barcode-metrics', help="The path to the metrics file produced by fgbio's DemuxFastqs used to infer the sample prefixes.", required=False)
+    parser.add_argument('--with-sample-directories', help="The sample's metric file will be <output-dir>/<sample-name>/<sample-name><file-extension>", required=False, action='store_true', default=False)
+    parser.set_defaults(func=main)
+
+    return parser
+
+def main(parser, args):
+
+    if not args.output.endswith(DefsBundleExtension):
+        fail_parser(parser, f"--output must end with {DefsBundleExtension}: '{args.output}'")
+    if args.output_dir and not os.path.isdir(args.output_dir) and not is_archive(args.output_dir):
+        fail(f"--output-dir was not a directory or archive: '{args.output_dir}'")
+
+    # Read and validate the metric definitions, and load each transform script
+    metrics_defs = read_metric_defs(args.metric_defs)
+    for metrics_def in metrics_defs.values():
+        if metrics_def.transform_script and not os.path.isfile(metrics_def.transform_script):
+            fail(f"Metric '{metrics_def.name}' transform script not found: {metrics_def.transform_script}")
+        metrics_def.load_transform()
+
+    # Maybe infer the metric types from the metric files
+    if args.output_dir:
+        file_index = MetricFileIndex(output_dir=args.output_dir,
+                extensions=[m.file_extension for m in metrics_defs.values()],
+                with_sample_directories=args.with_sample_directories)
+        sample_names = find_sample_names(parser, args, metrics_defs, file_index)
+        infer_metric_types(metrics_defs, file_index, sample_names)
+        for metrics_def in metrics_defs.values():
+            if metrics_def.column_types is None:
+                sys.stderr.write(f"No metric files found for '{metrics_def.name}', its types will be inferred on each run\n")
+
+    sys.stderr.write(f"Writing to {args.output}\n")
+    write_defs_bundle(args.output, metrics_defs, source=args.metric_defs)
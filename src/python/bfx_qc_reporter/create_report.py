@@ -6,7 +6,16 @@ import re
 import argparse
 from collections import OrderedDict
 import json
+import concurrent.futures
 from bfx_qc_reporter.util.parser import *
+from bfx_qc_reporter.util.util import fail, csv_row
+from bfx_qc_reporter.util.matrix import MetricMatrix, Missing
+from bfx_qc_reporter.util.json_io import read_json_samples, write_json_samples
+from bfx_qc_reporter.util.store import is_store, read_store
+from bfx_qc_reporter.util.histogram import HistogramReader, HistogramWriter
+from bfx_qc_reporter.util.stats import Stats
+from bfx_qc_reporter.util.viewer import write_viewer_shards
+from bfx_qc_reporter.util.thresholds import read_threshold_defs, evaluate_thresholds
 
 def add_subparser(subparsers):
     description="""
@@ -14,6 +23,11 @@ def add_subparser(subparsers):
 
     # The Metrics to Report
 
+    The --input option specifies the path to the JSON output of load-metrics.
+    Newline-delimited JSON output (with a .ndjson or .jsonl extension) is read
+    one sample at a time.  For a metric store (with a .sqlite or .db extension),
+    only the reported metrics are read.
+
     The --report-defs option specifies the path to the report definitions, 
     comma-delimited. Each line should contain four values: 
     1. The name of the metric group
@@ -37,85 +51,269 @@ def add_subparser(subparsers):
     - the metric name
     - for each sample, the value of the metric
 
+    # QC Thresholds
+
+    The --thresholds option specifies the path to the threshold definitions,
+    comma-delimited.  Each line should contain five values:
+    1. The name of the metric group
+    2. The category, or '*' for all categories
+    3. The metric name in the JSON
+    4. The level, either "warn" or "fail"
+    5. The expression for when the metric is flagged: a comparison operator (one of
+       <, <=, >, >=, ==, !=) followed by a value (ex. "< 0.9")
+
+    Each threshold is evaluated over the metric across all samples at once (using
+    NumPy when installed).  A sample's status for a threshold is PASS, WARN, FAIL, or
+    Missing if the sample does not have the metric, and its overall status is FAIL if
+    any threshold failed, otherwise WARN if any threshold warned, otherwise PASS.
+    The statuses are added to the report as the "QC Status" group, with one metric
+    per threshold (named by the metric and expression, with the metric group and
+    category as the category) and the overall status.  A summary with the number of
+    samples with each status for each threshold is written to
+    <output-prefix>.thresholds.csv.
+
+    # Many Reports
+
+    More than one report may be written from a single read of the --input, by
+    giving the same number of --report-defs and --output-prefix values (the first
+    report definitions are written with the first output prefix, and so on), or by
+    giving a --reports file with one report per line: the path to the report
+    definitions, the output prefix, and optionally "transpose" to transpose that
+    report (otherwise --transpose is used), comma-delimited.  The metrics for all
+    reports are read once, and a metric in more than one report is looked up only
+    once.  The reports are written in parallel with --threads.  The options
+    --thresholds, --viewer, and --histograms apply to every report.
+
+    # HTML Viewer Data
+
+    If --viewer is given, the report is also written for the HTML viewer as small
+    data shards, one per metric group and page of samples, with a manifest, to the
+    <output-prefix>.viewer directory.
+
+    # Statistics and Profiling
+
+    The --stats option writes a JSON file with the wall and CPU time of each phase
+    (definition loading, input read, thresholds, compile, CSV write, JSON write, and
+    histograms)
+    and the peak resident set size.  The --trace-memory option also records the
+    peak memory allocated by Python, as measured by tracemalloc, but slows the run
+    several times over.  The --profile option writes a cProfile profile.
+
+    # Histograms
+
+    If --histograms is given, the histograms collated by load-metrics with its
+    --histograms option are read from the files next to the --input file (ex.
+    <prefix>.histograms.json and <prefix>.histograms.bin for <prefix>.json).  The
+    histograms for the metric groups in the --report-defs file are written to
+    <output-prefix>.histograms.json and <output-prefix>.histograms.bin, in the same
+    format.  Only the reported histograms are read.
+
     """
 
     parser = build_subparser(subparsers, source_file=__file__, description=description)
 
     parser.add_argument('--input', help='The path to the input file.', required=True)
-    parser.add_argument('--output-prefix', help='The path prefix for the output files', required=True)
+    parser.add_argument('--output-prefix', help='The path prefix for the output files, one per --report-defs', required=False, default=[], nargs='+')
     parser.add_argument('--transpose', help='Transpose the rows and columns.', required=False, action='store_true', default=False)
-    parser.add_argument('--report-defs', help="The path to the report definitions.", required=False, default=os.path.join(os.path.abspath(__file__), "resources", "report_defs.csv"))
+    parser.add_argument('--report-defs', help="The path to the report definitions, one per --output-prefix.", required=False, nargs='+',
+            default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "report_defs.csv")])
+    parser.add_argument('--reports', help="The path to a file of report definitions, output prefixes, and (optionally) \"transpose\", one report per line.", required=False, default=None)
+    parser.add_argument('--threads', help="The number of threads used to write the reports.", required=False, type=int, default=1)
+    parser.add_argument('--thresholds', help="The path to the QC threshold definitions.", required=False, default=None)
+    parser.add_argument('--viewer', help="Also write the report as data shards for the HTML viewer to the <output-prefix>.viewer directory.", required=False, action='store_true', default=False)
+    parser.add_argument('--histograms', help="Also output the histograms for the reported metric groups.", required=False, action='store_true', default=False)
+    parser.add_argument('--stats', help="Write timing and peak memory statistics as JSON to this path.", required=False, default=None)
+    parser.add_argument('--trace-memory', help="Also record the peak memory allocated by Python in the --stats output, which slows the run.", required=False, action='store_true', default=False)
+    parser.add_argument('--profile', help="Write a cProfile profile to this path.", required=False, default=None)
     parser.set_defaults(func=main)
 
     return parser
 
-def main(parser, args):
-
-    # Read in the JSON data
-    with open(args.input, "r") as fh:
-        json_string = ""
-        for line in fh:
-            json_string += line
-        json_data = json.loads(json_string, object_pairs_hook=OrderedDict)
-
-    # Read in the report definitions
-    with open(args.report_defs, "r") as fh:
+def read_report_defs(path):
+    """ Reads the report definitions, skipping comment lines. """
+    with open(path, "r") as fh:
         report_defs = []
         for line in fh:
             if line.startswith("#"):
                 continue
             report_defs.append(line.rstrip("\r\n").split(","))
+    return report_defs
+
+def read_reports(path):
+    """
+    Reads the reports to write, returning a list of (report definitions path, output
+    prefix, transpose), where transpose is None if not given.
+    """
+    reports = []
+    with open(path, "r") as fh:
+        for line in fh:
+            if line.startswith("#") or not line.strip():
+                continue
+            tokens = line.rstrip("\r\n").split(",")
+            if len(tokens) not in [2, 3] or (len(tokens) == 3 and tokens[2] not in ["", "transpose"]):
+                fail(f"Expected the report definitions, output prefix, and optionally 'transpose' in {path}, found: {line.rstrip()}")
+            reports.append((tokens[0], tokens[1], True if len(tokens) == 3 and tokens[2] else None))
+    return reports
+
+def compile_report(metric_data, report_defs, lookups=None):
+    """
+    Compiles the report definitions over the metric matrix into a query plan: a list
+    of (group, category, name, display name, values) with one entry per reported row,
+    where the values have one value per sample ("Missing" if the sample does not have
+    the metric).  Categories given as '*' are resolved against the categories of the
+    metric group, and each metric is looked up only once.  The lookups may be shared
+    across reports over the same metric matrix, so that each metric is looked up only
+    once across all the reports.
+    """
+    missing = ["Missing"] * len(metric_data.sample_names)
+    lookups = dict() if lookups is None else lookups
+    def lookup(group, category, name):
+        key = (group, category, name)
+        if key not in lookups:
+            row = metric_data.row(group, category, name)
+            lookups[key] = missing if row is None else ["Missing" if value is Missing else value for value in row]
+        return lookups[key]
 
-    def recursively_add(data, *args):
-        """ Recursively adds a new dictionary at the given args. """
-        for arg in args:
-            if not arg in data:
-                data[arg] = OrderedDict()
-            data = data[arg]
-
-    # Go through the report defs and print the relevant metrics
-    sample_names = list(json_data.keys())
-    header       = ["group", "category", "name"] + sample_names
-    json_out     = OrderedDict([(name, OrderedDict()) for name in sample_names]) 
-    csv_out      = [header]
+    plan = []
     for report_def in report_defs:
-        # get the metric to report
         group, category, name, display_name = report_def
-        if category == '*':
-            categories = [c for c in sample_data[group].keys()]
-        else: 
-            categories = [category]
+        categories = metric_data.categories(group) if category == '*' else [category]
         for category in categories:
-            # get the values for the CSV output
-            def value_from(sample_data):
-                try:
-                    return sample_data[group][category][name]
-                except KeyError:
-                    return "Missing"
-            values = [value_from(sample_data) for sample_data in json_data.values()]
-            values = [str(value) for value in values if not values is None]
-            values = [group, category, display_name] + values
-            csv_out.append(values)
-            # add the values for the JSON output
-            for sample_name, sample_data in json_data.items():
-                recursively_add(json_out[sample_name], group, category, name)
-                json_out[sample_name][group][category][name] = value_from(sample_data)
+            plan.append((group, category, name, display_name, lookup(group, category, name)))
+    return plan
+
+def threshold_plan(threshold_results, overall):
+    """
+    Returns the report rows, as in compile_report, for the status of each sample for
+    each evaluated threshold and the overall status of each sample.
+    """
+    plan = []
+    for threshold_def, category, statuses in threshold_results:
+        label = threshold_def.label()
+        plan.append(("QC Status", f"{threshold_def.group}/{category}", label, label, statuses))
+    plan.append(("QC Status", "Overall", "status", "Status", overall))
+    return plan
+
+def write_threshold_summary(threshold_results, overall, output_prefix):
+    """ Writes the number of samples with each status for each threshold to <output_prefix>.thresholds.csv. """
+    statuses = ["PASS", "WARN", "FAIL", "Missing"]
+    with open(output_prefix + ".thresholds.csv", "w") as fh:
+        sys.stderr.write(f"Writing to {fh.name}\n")
+        fh.write(csv_row(["group", "category", "name", "level", "threshold"] + statuses) + "\n")
+        for threshold_def, category, values in threshold_results:
+            counts = [str(values.count(status)) for status in statuses]
+            fh.write(csv_row([threshold_def.group, category, threshold_def.name, threshold_def.level, threshold_def.expression] + counts) + "\n")
+        fh.write(csv_row(["QC Status", "Overall", "status", "", ""] + [str(overall.count(status)) for status in statuses]) + "\n")
+    sys.stderr.write("QC status: " + ", ".join(f"{overall.count(status)} {status}" for status in statuses[:3]) + "\n")
+
+def write_report(metric_data, report_defs, output_prefix, transpose=False, stats=None, threshold_defs=None, viewer=False, lookups=None):
+    """
+    Writes the report for the given report definitions over the metric matrix to
+    <output_prefix>.csv and <output_prefix>.json.  If threshold definitions are
+    given, the status of each sample is added to the report, and a summary is
+    written to <output_prefix>.thresholds.csv.  If viewer is true, the report is
+    also written as data shards for the HTML viewer.  The lookups are as in
+    compile_report.
+    """
+    stats        = stats or Stats()
+    if threshold_defs:
+        stats.start_phase("thresholds")
+        threshold_results, overall = evaluate_thresholds(metric_data, threshold_defs)
+        write_threshold_summary(threshold_results, overall, output_prefix)
+    stats.start_phase("compile")
+    plan         = compile_report(metric_data, report_defs, lookups)
+    if threshold_defs:
+        plan.extend(threshold_plan(threshold_results, overall))
+    sample_names = metric_data.sample_names
 
     # CSV output
-    fn_csv = args.output_prefix + ".csv" 
+    stats.start_phase("csv write")
+    fn_csv = output_prefix + ".csv" 
     with open(fn_csv, "w") as fh:
         sys.stderr.write(f"Writing to {fh.name}\n")
-        if args.transpose:
-            num_columns = len(csv_out[0])
-            for i in range(num_columns):
-                values = [datum[i] for datum in csv_out]
-                fh.write(",".join(values) + "\n")
+        if transpose:
+            # the group, category, and display name rows, then one row per sample
+            for header, index in [("group", 0), ("category", 1), ("name", 3)]:
+                fh.write(csv_row([header] + [query[index] for query in plan]) + "\n")
+            for i, sample_name in enumerate(sample_names):
+                fh.write(csv_row([sample_name] + [values[i] for _, _, _, _, values in plan]) + "\n")
         else:
-            for datum in csv_out:
-                fh.write(",".join(datum) + "\n")
+            fh.write(csv_row(["group", "category", "name"] + sample_names) + "\n")
+            for group, category, _, display_name, values in plan:
+                fh.write(csv_row([group, category, display_name] + values) + "\n")
 
-    # JSON otput
-    fn_json = args.output_prefix + ".json" 
+    # JSON otput, one sample at a time
+    stats.start_phase("json write")
+    fn_json = output_prefix + ".json" 
     with open(fn_json, "w") as fh:
         sys.stderr.write(f"Writing to {fh.name}\n")
-        fh.write(json.dumps(json_out, sort_keys=False, indent=4, separators=(',', ': ')))
+        def sample_json(i):
+            sample_data = OrderedDict()
+            for group, category, name, _, values in plan:
+                sample_data.setdefault(group, OrderedDict()).setdefault(category, OrderedDict())[name] = values[i]
+            return sample_data
+        write_json_samples(fh, ((sample_name, sample_json(i)) for i, sample_name in enumerate(sample_names)))
+
+    # Data shards for the HTML viewer
+    if viewer:
+        stats.start_phase("viewer write")
+        sys.stderr.write(f"Writing to {output_prefix}.viewer\n")
+        write_viewer_shards(output_prefix, sample_names, (((group, category, display_name), values) for group, category, _, display_name, values in plan))
+
+def main(parser, args):
+
+    # Pair up the report definitions with the output prefixes
+    if args.reports:
+        reports = read_reports(args.reports)
+    elif len(args.report_defs) != len(args.output_prefix):
+        fail_parser(parser, f"The same number of --report-defs ({len(args.report_defs)}) and --output-prefix ({len(args.output_prefix)}) must be given.")
+    else:
+        reports = [(report_defs, output_prefix, None) for report_defs, output_prefix in zip(args.report_defs, args.output_prefix)]
+
+    stats = Stats(enabled=args.stats is not None, trace_memory=args.trace_memory, profile_path=args.profile)
+
+    # Read in the report definitions
+    stats.start_phase("definition loading")
+    reports        = [(read_report_defs(path), output_prefix, args.transpose if transpose is None else transpose) for path, output_prefix, transpose in reports]
+    threshold_defs = read_threshold_defs(args.thresholds) if args.thresholds else []
+
+    # Read in only the reported metrics from a metric store, otherwise read in the JSON
+    # data one sample at a time, keeping only the reported metric groups, for all reports
+    stats.start_phase("input read")
+    keys   = [tuple(report_def[:3]) for report_defs, _, _ in reports for report_def in report_defs] + [(t.group, t.category, t.name) for t in threshold_defs]
+    keys   = list(OrderedDict.fromkeys(keys))
+    groups = list(OrderedDict.fromkeys(key[0] for key in keys))
+    if is_store(args.input):
+        metric_data = read_store(args.input, keys=keys)
+    else:
+        metric_data = MetricMatrix.from_samples(read_json_samples(args.input), groups=groups)
+
+    # Write the reports, sharing the metric lookups, possibly in parallel
+    lookups = dict()
+    if len(reports) == 1 or args.threads <= 1:
+        for report_defs, output_prefix, transpose in reports:
+            write_report(metric_data, report_defs, output_prefix, transpose=transpose, stats=stats, threshold_defs=threshold_defs, viewer=args.viewer, lookups=lookups)
+    else:
+        stats.start_phase("reports")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
+            futures = [executor.submit(write_report, metric_data, report_defs, output_prefix, transpose=transpose,
+                    threshold_defs=threshold_defs, viewer=args.viewer, lookups=lookups) for report_defs, output_prefix, transpose in reports]
+            for future in futures:
+                future.result()
+
+    # Histogram output
+    if args.histograms:
+        stats.start_phase("histograms")
+        reader = HistogramReader(os.path.splitext(args.input)[0])
+        for report_defs, output_prefix, _ in reports:
+            writer = HistogramWriter(output_prefix)
+            sys.stderr.write(f"Writing to {writer.fh.name}\n")
+            for sample_name in metric_data.sample_names:
+                for group in OrderedDict.fromkeys(report_def[0] for report_def in report_defs):
+                    columns = reader.get(sample_name, group)
+                    if columns is not None:
+                        writer.add(sample_name, group, columns)
+            writer.close()
+        reader.close()
+
+    stats.write(args.stats)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+import os
+import re
+import sys
+import csv
+import argparse
+from collections import OrderedDict
+from bfx_qc_reporter.util.parser import *
+from bfx_qc_reporter.util.util import fail
+from bfx_qc_reporter.util.archive import is_archive, open_archive
+from bfx_qc_reporter.load_metrics import to_sample_names, sniff_metric_file, SniffBytes
+
+PicardDocUrl = "http://broadinstitute.github.io/picard/picard-metric-definitions.html"
+FgbioDocUrl  = "http://fulcrumgenomics.github.io/fgbio/metrics/latest/"
+
+def add_subparser(subparsers):
+    description="""
+    Discovers the metric files in an output directory and writes metric definitions for load-metrics.
+
+    # Finding the Metric Files
+
+    The output directory (or archive) is scanned once.  The file extension of each
+    file is the file name after the sample name, where the sample names are given
+    with --sample-names or --demux-barcode-metrics, or are the per-sample directory
+    names with --with-sample-directories.  Otherwise the file extension is the file
+    name from its first period (ex. ".alignment_summary_metrics.txt" for
+    "sample1.alignment_summary_metrics.txt").  A ".gz" suffix is ignored.
+
+    # Classifying the Metric Files
+
+    Only the first file for each file extension is read, and only its first 4KB,
+    to classify it as a Picard, fgbio, DemuxFastqs, CSV, or other tabular metric
+    file.  The metric group name is taken from the Picard metrics class (ex.
+    "Alignment Summary Metrics" for "picard.analysis.AlignmentSummaryMetrics"),
+    otherwise from the file extension.  If the first rows of the metric table have
+    a column with a distinct, non-numeric value per row, it is used as the
+    category.
+
+    # Output
+
+    The metric definitions are written to --output, and should be reviewed before
+    use with load-metrics.
+
+    """
+
+    parser = build_subparser(subparsers, source_file=__file__, description=description)
+
+    parser.add_argument('--output-dir', help='The path to the directory or archive containing the metric files', required=True)
+    parser.add_argument('--output', help='The path to which to write the metric definitions.', required=True)
+    parser.add_argument('--sample-names', help="The sample names, used to find the file extensions.", required=False, default=[], nargs='+')
+    parser.add_argument('--demux-barcode-metrics', help="The path to the metrics file produced by fgbio's DemuxFastqs used to infer the sample names.", required=False)
+    parser.add_argument('--with-sample-directories', help="The sample's metric files are in <output-dir>/<sample-name>/.", required=False, action='store_true', default=False)
+    parser.set_defaults(func=main)
+
+    return parser
+
+def list_files(output_dir, with_sample_directories=False):
+    """
+    Lists the files in the output directory (or archive) with a single scan, as
+    (directory, file name) tuples, including those in each per-sample directory if
+    with_sample_directories is true.
+    """
+    files = []
+    if is_archive(output_dir):
+        for member in open_archive(output_dir).names():
+            parts = member.split("/")
+            if len(parts) == (2 if with_sample_directories else 1):
+                directory = os.path.join(output_dir, parts[0]) if with_sample_directories else output_dir
+                files.append((directory, parts[-1]))
+        return files
+    directories = [output_dir]
+    if with_sample_directories:
+        with os.scandir(output_dir) as it:
+            directories = [entry.path for entry in it if entry.is_dir()]
+    for directory in directories:
+        with os.scandir(directory) as it:
+            files.extend((directory, entry.name) for entry in it if entry.is_file())
+    return files
+
+def file_extension(directory, name, sample_names, with_sample_directories=False):
+    """ Returns the file extension of the metric file, or None if it is not a metric file for a sample. """
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if with_sample_directories:
+        sample_name = os.path.basename(directory)
+        return name[len(sample_name):] if name.startswith(sample_name + ".") else None
+    if sample_names:
+        matches = [sample_name for sample_name in sample_names if name.startswith(sample_name + ".")]
+        return name[len(max(matches, key=len)):] if matches else None
+    return name[name.index("."):] if "." in name[1:] else None
+
+def extension_group_name(ext):
+    """ Returns a metric group name from the file extension (ex. "Duplication Metrics" for ".duplication_metrics.txt"). """
+    name = re.sub(r"\.(txt|tsv|csv)$", "", ext.lstrip("."))
+    name = " ".join(word.capitalize() for word in re.split(r"[._\-]+", name) if word)
+    return name if name.lower().endswith("metrics") else name + " Metrics"
+
+def group_name(parser, prefix, ext):
+    """
+    Returns the name of the metric group and its documentation URL, from the Picard
+    metrics class if present, otherwise from the file extension.
+    """
+    if parser.name == "Picard":
+        for line in prefix:
+            if line.startswith("## METRICS CLASS"):
+                metrics_class = line.split("\t")[-1].split(".")[-1].split("$")[-1]
+                return re.sub(r"(?<=[a-z])(?=[A-Z])", " ", metrics_class), f"{PicardDocUrl}#{metrics_class}"
+    return extension_group_name(ext), (FgbioDocUrl if parser.name in ["fgbio", "DemuxFastqs"] else "")
+
+def guess_category(parser, prefix, truncated):
+    """
+    Guesses the category column from the rows of the metric table in the prefix: the
+    first column with a distinct, non-numeric value in each row, or None if the table
+    has only one row.  The last line is ignored if the prefix was truncated.
+    """
+    if parser.name == "DemuxFastqs":
+        return None # one category per barcode name by default
+    lines = prefix[:-1] if truncated else prefix
+    if parser.name == "Picard":
+        starts = [i for i, line in enumerate(lines) if line.startswith("## METRICS CLASS")]
+        lines  = lines[starts[0] + 1:] if starts else []
+    table = []
+    for line in lines:
+        if not line:
+            break
+        table.append(line)
+    rows = list(csv.reader(table)) if parser.name == "CSV" else [line.split("\t") for line in table]
+    if len(rows) < 3: # the header and at most one row
+        return None
+    header, rows = rows[0], rows[1:]
+    for i, name in enumerate(header):
+        values = [row[i] for row in rows if i < len(row)]
+        if len(values) == len(rows) and len(set(values)) == len(values) and not any(re.match(r"^-?[0-9.]+$", value) for value in values):
+            return name
+    return None
+
+def main(parser, args):
+
+    if not os.path.isdir(args.output_dir) and not is_archive(args.output_dir):
+        fail(f"--output was not a directory or archive: '{args.output_dir}'")
+    if args.demux_barcode_metrics and args.sample_names:
+        fail_parser(parser, "Both --demux-barcode-metrics and --sample-names cannot be given.")
+    sample_names = to_sample_names(args.demux_barcode_metrics) if args.demux_barcode_metrics else args.sample_names
+
+    # Find the first metric file for each file extension
+    paths = OrderedDict()
+    for directory, name in list_files(args.output_dir, args.with_sample_directories):
+        ext = file_extension(directory, name, sample_names, args.with_sample_directories)
+        if ext and ext not in paths:
+            paths[ext] = os.path.join(directory, name[:-3] if name.endswith(".gz") else name)
+
+    # Classify each from the start of the file
+    names = set()
+    with open(args.output, "w") as fh:
+        sys.stderr.write(f"Writing to {fh.name}\n")
+        for ext, path in paths.items():
+            metric_parser, prefix = sniff_metric_file(path)
+            if metric_parser is None:
+                sys.stderr.write(f"Skipping empty metric file: {path}\n")
+                continue
+            truncated = sum(len(line) + 1 for line in prefix) >= SniffBytes
+            name, doc = group_name(metric_parser, prefix, ext)
+            if name in names: # ex. Picard's DuplicationMetrics before and after mapping
+                name = f"{name} ({extension_group_name(ext)})"
+            names.add(name)
+            category  = guess_category(metric_parser, prefix, truncated)
+            sys.stderr.write(f"Found {metric_parser.name} metrics '{name}' with extension {ext}: {path}\n")
+            fh.write(",".join([name, ext, doc, category or ""]) + "\n")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import argparse
+from collections import OrderedDict
+from bfx_qc_reporter.util.parser import *
+from bfx_qc_reporter.util.util import fail
+from bfx_qc_reporter.util.matrix import MetricMatrix
+from bfx_qc_reporter.util.json_io import read_json_samples, write_json_samples
+from bfx_qc_reporter.util.store import is_store, read_store, write_store
+from bfx_qc_reporter.load_metrics import read_metric_defs, csv_header, csv_line
+
+def add_subparser(subparsers):
+    description="""
+    Merges the outputs of load-metrics run with --shard into a single output.
+
+    # Inputs
+
+    The --inputs option gives the output prefix of each shard, as given to
+    load-metrics with --output-prefix.  The manifest for each shard is read from
+    <prefix>.shard.json.  All N shards must be given, in any order.  The shards'
+    metric data are read one shard at a time.
+
+    # Outputs
+
+    The JSON and CSV outputs are identical to running load-metrics over all the
+    samples at once, including the order of the samples.  The same --metric-defs
+    must be given as to load-metrics.  Use --ndjson or --sqlite to write the same
+    output formats as load-metrics.
+
+    """
+
+    parser = build_subparser(subparsers, source_file=__file__, description=description)
+
+    script_dir = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+    parser.add_argument('--inputs', help='The output prefixes of the shards.', required=True, nargs='+')
+    parser.add_argument('--output-prefix', help='The path prefix for the output files', required=True)
+    parser.add_argument('--metric-defs', help="The path to the metric definitions, comma-delimited.", required=False,
+            default=os.path.join(script_dir, "resources", "metric_defs.csv"))
+    output_format = parser.add_mutually_exclusive_group()
+    output_format.add_argument('--ndjson', help="Write newline-delimited JSON (one sample per line) to <output-prefix>.ndjson instead of <output-prefix>.json.", required=False, action='store_true', default=False)
+    output_format.add_argument('--sqlite', help="Write an indexed SQLite metric store to <output-prefix>.sqlite instead of <output-prefix>.json.", required=False, action='store_true', default=False)
+    parser.set_defaults(func=main)
+
+    return parser
+
+def read_shard_manifest(prefix):
+    """ Reads the manifest written by load-metrics for a shard. """
+    with open(prefix + ".shard.json", "r") as fh:
+        return json.load(fh)
+
+def main(parser, args):
+
+    # Read and validate the shard manifests
+    manifests = OrderedDict()
+    for prefix in args.inputs:
+        manifest = read_shard_manifest(prefix)
+        if manifest["shard"] in manifests:
+            fail(f"Shard {manifest['shard']} was given more than once: {prefix}")
+        manifests[manifest["shard"]] = (prefix, manifest)
+    first = next(iter(manifests.values()))[1]
+    num_shards, sample_names = first["num_shards"], first["sample_names"]
+    for prefix, manifest in manifests.values():
+        if manifest["num_shards"] != num_shards or manifest["sample_names"] != sample_names:
+            fail(f"Shard {manifest['shard']} was not from the same set of shards: {prefix}")
+    missing = [str(i) for i in range(1, num_shards + 1) if i not in manifests]
+    if missing:
+        fail(f"Missing shard(s): {', '.join(missing)} of {num_shards}")
+
+    # Read the samples from each shard
+    metrics_defs = read_metric_defs(args.metric_defs)
+    shard_data   = dict()
+    for prefix, manifest in manifests.values():
+        data_path = os.path.join(os.path.dirname(prefix), manifest["data"])
+        if is_store(data_path):
+            store = read_store(data_path)
+            shard_data.update((sample_name, store.sample_dict(sample_name)) for sample_name in store.sample_names)
+        else:
+            shard_data.update(read_json_samples(data_path))
+
+    # Add the samples in their original order, so the metrics are ordered as in a single run
+    metric_data = MetricMatrix(sample_names=sample_names, groups=metrics_defs.keys())
+    for sample_name in sample_names:
+        for group, group_data in shard_data.pop(sample_name).items():
+            metric_data.add(sample_name, group, group_data)
+
+    # Write it to a metric store, or to JSON one sample at a time
+    if args.sqlite:
+        sys.stderr.write(f"Writing to {args.output_prefix}.sqlite\n")
+        write_store(args.output_prefix + ".sqlite", metric_data)
+    else:
+        with open(args.output_prefix + (".ndjson" if args.ndjson else ".json"), "w") as fh:
+            sys.stderr.write(f"Writing to {fh.name}\n")
+            samples = ((sample_name, metric_data.sample_dict(sample_name)) for sample_name in sample_names)
+            write_json_samples(fh, samples, ndjson=args.ndjson)
+
+    # Write it to a flattened CSV
+    with open(args.output_prefix + ".csv", "w") as fh:
+        sys.stderr.write(f"Writing to {fh.name}\n")
+        fh.write(csv_header(sample_names))
+        for (metric_group_name, category, metric_name), values in metric_data.rows():
+            fh.write(csv_line(metrics_defs[metric_group_name], category, metric_name, values))
@@ -7,8 +7,19 @@ import argparse
 from collections import OrderedDict
 import json
 from bfx_qc_reporter.util.parser import *
-from bfx_qc_reporter.util.util import fail
+from bfx_qc_reporter.util.util import fail, debug, set_verbosity, get_verbosity, csv_row
+from bfx_qc_reporter.util.matrix import MetricMatrix, Missing
+from bfx_qc_reporter.util.json_io import write_json_samples
+from bfx_qc_reporter.util.file_index import MetricFileIndex
+from bfx_qc_reporter.util.archive import is_archive, open_archive, open_metric_file, archive_order
+import csv
 import importlib
+import importlib.util
+import itertools
+import time
+# NB: the modules used only when loading many samples (statistics, the parse cache,
+# the metric store, histograms, the viewer, concurrent.futures, and NumPy) are
+# imported where they are used, so that load-sample starts quickly.
 
 def add_subparser(subparsers):
     description="""
@@ -30,7 +41,7 @@ def add_subparser(subparsers):
     # Definining the Metrics to Collate
 
     The --metric-defs option gives the path to a comma-delimited file containing
-    four columns with an optional fifth column:
+    four columns with an optional fifth and sixth column:
 
     1. The unique name of the metric (ex. "Alignment Summary Metrics").
     2. The file extension for the metric (ex. ".alignment_summary_metrics.txt")
@@ -47,6 +58,30 @@ def add_subparser(subparsers):
        If the script is not found at the given path, we attempt to find it in the same
        directory as the metrics definition file.
 
+       The script may instead (or also) have a method with signature
+       'transform_batch(group, category, name, values)' that transforms the values of
+       one metric across all samples at once, and returns the transformed values in
+       the same order.  Only samples with the metric are included in the values.  The
+       values are given as a list, or as a NumPy array if the script sets
+       'BATCH_AS_NUMPY = True' and NumPy is installed.  If both are defined,
+       'transform_batch' is used.  Each script is loaded once, when first used, and
+       shared across all metric definitions that use it.  The --metric-defs may also
+       be a bundle of validated definitions written by compile-defs.
+    6. A colon-delimited list of metric types, each of the form <metric-name>=<type>,
+       where the type is one of "int", "float", or "str" (ex. "percent_duplication=float").
+       Leave the fifth column blank if no transform script is used.
+
+    # Metric Value Types
+
+    The type of each metric is inferred once per metric definition from the first
+    non-empty metric file found: a metric is an integer if all its values are
+    integers, a float if all its values are numbers, and a string otherwise.  Metrics with "name" in
+    their name are always strings.  Values such as "", "?", and "NaN" are ignored when
+    inferring the type, and are never converted.  All subsequent metric files for the
+    same definition are converted using the same types, so that a metric has the same
+    type across samples.  Use the sixth column of the metric definitions to set the
+    type of a metric explicitly.
+
     # Finding the Metric Files
 
     The path to the file containing the metrics for specific sample is as follows:
@@ -54,6 +89,59 @@ def add_subparser(subparsers):
     This means the metric files for all samples should live in the same directory,
     and metrics for a given sample should share the same path prefix.
 
+    # Compressed Metric Files and Archives
+
+    A metric file may be compressed with gzip, in which case it is read from
+    <output-dir>/<sample-name><file-extension>.gz.  The --output-dir may also be a
+    tar (optionally compressed with gzip, bzip2, or xz) or zip archive, in which
+    case the metric files are read directly from the archive without extracting it.
+    The paths above are then relative to the root of the archive, or to its single
+    top-level directory if it has one (ex. "run1/" within "run1.tar.gz"), unless
+    that directory is a per-sample directory.  The archive is read once to index its
+    members, and the metric files are then read in the order they are stored, so
+    that a compressed archive is decompressed only once more.
+
+    # Parsing in Parallel
+
+    The metric files may be parsed concurrently with the --threads or --processes
+    options.  The output is identical to parsing the files serially.
+
+    # Caching Parsed Metric Files
+
+    The --cache-dir option specifies a directory in which the parsed metrics for
+    each metric file are cached, keyed on the path, size, and modification time of
+    the metric file as well as the metric definition.  Re-running on the same output
+    directory only parses new or modified metric files.  The least recently used
+    entries are removed once the cache exceeds --cache-max-mb.
+
+    # Sharding
+
+    The --shard option processes a deterministic subset of the samples, so that the
+    samples may be spread across many nodes.  With --shard <i>/<N>, every N-th sample
+    starting with the i-th (1-based) is processed, after the sample names are found
+    as above.  Each shard writes its outputs as usual for its samples, and a manifest
+    to <output-prefix>.shard.json.  Metric types are inferred from all samples, so
+    every shard uses the same types.  The gather command merges the N shards into
+    outputs identical to processing all samples at once.
+
+    # HTML Viewer Data
+
+    If --viewer is given, the metrics are also written for the HTML viewer as small
+    data shards, one per metric group and page of samples, with a manifest, to the
+    <output-prefix>.viewer directory.  The viewer reads only the shards for the
+    metrics and samples on screen.
+
+    # Statistics and Profiling
+
+    The --stats option writes a JSON file with the wall and CPU time of each phase
+    (definition loading, discovery, parsing, histograms, transform, JSON write, and
+    CSV write), the time taken to parse and the bytes read from each metric file,
+    the slowest files, and the peak resident set size.  The --trace-memory option
+    also records the peak memory allocated by Python, as measured by tracemalloc,
+    but slows the run several times over, so the times are then not meaningful.
+    The --profile option writes a cProfile profile, viewable with pstats or
+    snakeviz.  Use --verbose to list each metric file as it is parsed.
+
     # Output Files
 
     The output JSON file will contain the following hierarchy:
@@ -77,6 +165,32 @@ def add_subparser(subparsers):
     metric <metric-category> is either None if no category was given, or a 
     dash-delimited list of the categries given.
 
+    If --ndjson is given, the output is instead written as newline-delimited JSON,
+    with one line per sample containing the object {"<sample-name>" : { ... }}.
+
+    If --histograms is given, the "## HISTOGRAM" section of each Picard metric file
+    (ex. insert size and GC bias histograms) is also collated.  Each histogram is stored
+    as one array of doubles per histogram column in the binary file
+    <output-prefix>.histograms.bin, with an index in <output-prefix>.histograms.json:
+        {
+            "<sample-name>" : {
+                "<metric-group-name>" : {
+                    "offset" : <byte offset of the histogram in the binary file>,
+                    "length" : <number of rows in the histogram>,
+                    "columns" : [ <column name>, ... ]
+                },
+                ...
+            },
+            ...
+        }
+    Each column is stored as <length> little-endian doubles, one column after the
+    other, starting at <offset>.
+
+    If --sqlite is given, the output is instead written to a single-file SQLite
+    metric store, <output-prefix>.sqlite, with the metric values indexed by metric
+    group, category, and name.  The create-report command reads only the reported
+    metrics from the store.
+
     The output CSV file contain the following columns:
     - <metric-group-name>
     - <metric-category>
@@ -97,19 +211,29 @@ def add_subparser(subparsers):
 
     ## Fbio Metrics
 
-    Metric files produced by fgbio are supported.
+    Metric files produced by fgbio are supported.  The metrics produced by
+    DemuxFastqs have one category per barcode name, unless a <metric-category> is
+    given.
 
     ## CSV Files
 
     Comma-delimited text files are supported, but must have the first row be the
-    names of the metrics (a header row).
+    names of the metrics (a header row).  Values may be quoted.
+
+    ## Other Tabular Files
+
+    Any other tab-delimited file with a header row is read as a table.
+
+    The kind of each metric file is found from (at most) its first 4KB, regardless
+    of its file extension, in the order above.  Use the discover command to create
+    metric definitions for the metric files in an output directory.
 
     """
 
     parser = build_subparser(subparsers, source_file=__file__, description=description)
     
     script_dir = os.path.abspath(os.path.dirname(__file__))
-    parser.add_argument('--output-dir', help='The path to the directory containing the metric files', required=True)
+    parser.add_argument('--output-dir', help='The path to the directory or archive containing the metric files', required=True)
     parser.add_argument('--output-prefix', help='The path prefix for the output files', required=True)
     parser.add_argument('--metric-defs', help="The path to the metric definitions, comma-delimited.", required=False, 
             default=os.path.join(script_dir, "resources", "metric_defs.csv"))
@@ -117,12 +241,33 @@ def add_subparser(subparsers):
     parser.add_argument('--demux-barcode-metrics', help="The path to the metrics file produced by fgbio's DemuxFastqs used to infer the sample prefixes.", required=False)
     parser.add_argument('--error-when-missing', help="Exit with an error if a missing metric file is found, otherwise warn.", required=False, action='store_true', default=False)
     parser.add_argument('--with-sample-directories', help="The sample's metric file will be <output-dir>/<sample-name>/<sample-name><file-extension>", required=False, action='store_true', default=False)
+    parser.add_argument('--cache-dir', help="The path to a directory in which to cache parsed metric files; only new or modified files are re-parsed.", required=False, default=None)
+    parser.add_argument('--cache-max-mb', help="The maximum size of the parsed metrics cached in --cache-dir, in megabytes.", required=False, type=int, default=1024)
+    output_format = parser.add_mutually_exclusive_group()
+    output_format.add_argument('--ndjson', help="Write newline-delimited JSON (one sample per line) to <output-prefix>.ndjson instead of <output-prefix>.json.", required=False, action='store_true', default=False)
+    output_format.add_argument('--sqlite', help="Write an indexed SQLite metric store to <output-prefix>.sqlite instead of <output-prefix>.json.", required=False, action='store_true', default=False)
+    parser.add_argument('--histograms', help="Also collate the histograms in Picard metric files to <output-prefix>.histograms.bin and <output-prefix>.histograms.json.", required=False, action='store_true', default=False)
+    parser.add_argument('--viewer', help="Also write the metrics as data shards for the HTML viewer to the <output-prefix>.viewer directory.", required=False, action='store_true', default=False)
+    parser.add_argument('--shard', help="Process only the <i>-th of <N> shards of the samples, given as <i>/<N> (1-based).  Use the gather command to merge the shards.", required=False, default=None)
+    parser.add_argument('--stats', help="Write timing, per-file, and peak memory statistics as JSON to this path.", required=False, default=None)
+    parser.add_argument('--trace-memory', help="Also record the peak memory allocated by Python in the --stats output, which slows the run.", required=False, action='store_true', default=False)
+    parser.add_argument('--stats-slowest', help="The number of slowest files to list in the --stats output.", required=False, type=int, default=10)
+    parser.add_argument('--profile', help="Write a cProfile profile to this path.", required=False, default=None)
+    parser.add_argument('-v', '--verbose', help="Increase the verbosity; use once to list each metric file parsed.", required=False, action='count', default=0)
+    workers = parser.add_mutually_exclusive_group()
+    workers.add_argument('--threads', help="The number of threads used to parse metric files.", required=False, type=int, default=1)
+    workers.add_argument('--processes', help="The number of processes used to parse metric files.", required=False, type=int, default=None)
     parser.set_defaults(func=main)
 
     return parser
 
 
 __ErrorIfWarning = False
+def set_error_if_warning(value):
+    """ Sets whether warnings should be treated as errors. """
+    global __ErrorIfWarning
+    __ErrorIfWarning = value
+
 def warn(msg):
     global __ErrorIfWarning
     if __ErrorIfWarning:
@@ -137,7 +282,7 @@ def to_sample_names(path):
     from the metrics file produced by fgbio's DemuxFastqs.
     """
     sample_names = []
-    with open(path, "r") as fh:
+    with open_metric_file(path) as fh:
         line_iter = iter(line.rstrip("\r\n") for line in fh)
         header = [line.lower() for line in next(line_iter).split("\t")]
         for line in line_iter:
@@ -171,25 +316,125 @@ def format_value(name, value):
             pass
     return retval
 
-def to_dict_from_table(path, lines, category=None):
+# Values treated as absent when inferring the type of a column, and never converted.
+NullValues = frozenset(["", "?", "NaN", "nan", "NA", "null"])
+
+def to_int(value):
+    """ Converts the value to an integer, falling back to a float, otherwise returns the original value. """
+    try:
+        return int(value)
+    except ValueError:
+        return to_float(value)
+
+def to_float(value):
+    """ Converts the value to a float, otherwise returns the original value. """
+    if value in NullValues:
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def to_str(value):
+    """ Returns the original value. """
+    return value
+
+ColumnConverters = OrderedDict([("int", to_int), ("float", to_float), ("str", to_str)])
+
+def infer_column_type(name, values):
+    """
+    Infers the type of a column ("int", "float", or "str") from its name and values.
+    Columns with "name" in their name are always strings, and values in NullValues are
+    ignored.  Returns None if the type is unknown, as every value is in NullValues.
+    """
+    if "name" in name:
+        return "str"
+    values = [value for value in values if value not in NullValues]
+    if not values:
+        return None
+    for column_type, convert in [("int", int), ("float", float)]:
+        try:
+            for value in values:
+                convert(value)
+            return column_type
+        except ValueError:
+            pass
+    return "str"
+
+def column_converter(name, column_types):
+    """
+    Returns the function to convert the values of the named column to its type in
+    column_types, or to guess the type of each value if the column has no type.
+    """
+    if column_types is not None and name in column_types:
+        return ColumnConverters[column_types[name]]
+    return lambda value: format_value(name, value)
+
+def convert_metric_dict(data, category=None, column_types=None, category_values=None):
+    """
+    Converts the metrics parsed as strings (with column_types="str") to the given
+    column types, keeping only the categories in category_values if given, as if the
+    metric file had been parsed with the column types.  The categories are those of
+    the parsed metrics (ex. the barcode names of a DemuxFastqs file), and are only
+    computed again from the converted values if a category is given.
+    """
+    converted = OrderedDict()
+    for category_value, row_dict in data.items():
+        row_dict = OrderedDict((name, column_converter(name, column_types)(value)) for name, value in row_dict.items())
+        if category:
+            category_value = "-".join([str(row_dict[c]) for c in category])
+        elif category_value == "None": # the metric file has no category, so it is always kept
+            converted[category_value] = row_dict
+            continue
+        if category_values is None or category_value in category_values:
+            converted[category_value] = row_dict
+    return converted
+
+def to_dict_from_table(path, lines, category=None, column_types=None, columns=None, category_values=None, delimiter="\t"):
     """
     Converts a tabular (with header) file into a dictionary, with one
     key per metric category (or "None" if no category exists).  The value per category
     is a map from metric name to value.  All metric names will be changed to
-    lowercase.
+    lowercase.  The lines are consumed only up to the first empty line.
+
+    If column_types is given, it maps each metric name to its type ("int", "float",
+    or "str"), and the values in each column are converted to that type.  Columns
+    without a type have their type guessed per value.  If column_types is the string
+    "str", all values are left as strings.
+
+    If columns is given, only the metrics with those names (and the category
+    columns) are kept and converted.  If category_values is given, only the
+    categories with those values are kept.
+
+    The values are tab-delimited by default.  If the delimiter is a comma, the lines
+    are read with the csv module, so that quoted values may contain commas.
     """
-    line_iter = iter(line for line in lines)
+    line_iter = itertools.takewhile(bool, lines)
+    if delimiter == "\t":
+        row_iter = (line.split("\t") for line in line_iter)
+    else:
+        row_iter = csv.reader(line_iter, delimiter=delimiter)
     row_dicts = []
     try:
-        header = [line.lower() for line in next(line_iter).split("\t")]
+        header = [name.lower() for name in next(row_iter)]
     except StopIteration:
         warn(f"empty metric file: {path}")
         return OrderedDict()
-    for line in line_iter:
-        if not line:
-            break
-        row      = [value for value in line.split("\t")]
-        row_dict = OrderedDict([(name, format_value(name, value)) for name, value in zip(header, row)])
+    keep = None
+    if columns is not None:
+        keep   = [i for i, name in enumerate(header) if name in columns or (category and name in category)]
+        header = [header[i] for i in keep]
+    if column_types == "str":
+        converters = [to_str for name in header]
+    elif column_types is not None:
+        converters = [column_converter(name, column_types) for name in header]
+    for values in row_iter:
+        if keep is not None:
+            values = [values[i] for i in keep]
+        if column_types is None:
+            row_dict = OrderedDict([(name, format_value(name, value)) for name, value in zip(header, values)])
+        else:
+            row_dict = OrderedDict([(name, convert(value)) for name, convert, value in zip(header, converters, values)])
         row_dicts.append(row_dict)
 
     data = OrderedDict()
@@ -197,49 +442,212 @@ def to_dict_from_table(path, lines, category=None):
     if category:
         for row_dict in row_dicts:
             category_value = "-".join([str(row_dict[c]) for c in category])
-            data[category_value] = row_dict
+            if category_values is None or category_value in category_values:
+                data[category_value] = row_dict
         return data
     else:
         assert len(row_dicts) == 1
         data = OrderedDict({"None" : row_dicts[0]})
     return data
 
-def to_dict_from_picard(path, lines, category=None):
+def to_dict_from_picard(path, lines, category=None, column_types=None, columns=None, category_values=None):
     """
     Converts in a Picard-style metric into a dictionary, with one key per
     metric category (or "None" if no category exists).  The value per category
     is a map from metric name to value.  All metric names will be changed to
-    lowercase.
+    lowercase.  The lines are consumed only up to the end of the metrics table.
+    """
+    line_iter = iter(lines)
+    for line in line_iter:
+        if line.startswith("## METRICS CLASS"):
+            break
+    return to_dict_from_table(path, line_iter, category, column_types, columns, category_values)
+
+def to_dict_from_demux(path, lines, category=None, column_types=None, columns=None, category_values=None):
+    """
+    Converts the metrics produced by fgbio's DemuxFastqs into a dictionary, as in
+    to_dict_from_table, with one category per barcode name unless a category is given.
     """
-    line_iter = iter(line for line in lines)
+    return to_dict_from_table(path, lines, category or ["barcode_name"], column_types, columns, category_values)
+
+def to_dict_from_csv(path, lines, category=None, column_types=None, columns=None, category_values=None):
+    """ Converts a comma-delimited (with header) file into a dictionary, as in to_dict_from_table. """
+    return to_dict_from_table(path, lines, category, column_types, columns, category_values, delimiter=",")
+
+# The maximum number of bytes read from the start of a metric file to classify it
+SniffBytes = 4096
+
+# The names of fgbio metrics, in snake case (ex. "barcode_name")
+FgbioHeaderRegex = re.compile(r"^[a-z][a-z0-9_]*$")
+
+def is_picard(lines):
+    """ True if the lines start a Picard metric file. """
+    return lines[0].startswith("## htsjdk.samtools.metrics.StringHeader") or any(line.startswith("## METRICS CLASS") for line in lines)
+
+def is_demux(lines):
+    """ True if the lines start a metric file produced by fgbio's DemuxFastqs. """
+    return {"barcode_name", "library_name", "barcode"}.issubset(lines[0].split("\t"))
+
+def is_csv(lines):
+    """ True if the lines start a comma-delimited file. """
+    return "," in lines[0] and "\t" not in lines[0]
+
+def is_fgbio(lines):
+    """ True if the lines start a tab-delimited file with fgbio-style (snake case) metric names. """
+    return all(FgbioHeaderRegex.match(name) for name in lines[0].split("\t"))
+
+class MetricParser(object):
+    """
+    A parser for one kind of metric file.  The sniff method classifies a file from
+    the lines in a bounded prefix of the file (at least one line), and the parse
+    method has the same signature as to_dict_from_table.
+    """
+
+    def __init__(self, name, sniff, parse):
+        self.name  = name
+        self.sniff = sniff
+        self.parse = parse
+
+# The metric file parsers, in the order that they are tried
+MetricParsers = OrderedDict()
+
+def register_parser(name, sniff, parse):
+    """
+    Registers a parser for a kind of metric file.  Parsers are tried in the order
+    they are registered, except that the tabular parser, which accepts any file, is
+    always tried last.  Registering a parser with an existing name replaces it.
+    """
+    MetricParsers[name] = MetricParser(name, sniff, parse)
+    if "tabular" in MetricParsers and name != "tabular":
+        MetricParsers.move_to_end("tabular")
+
+register_parser("Picard", is_picard, to_dict_from_picard)
+register_parser("DemuxFastqs", is_demux, to_dict_from_demux)
+register_parser("CSV", is_csv, to_dict_from_csv)
+register_parser("fgbio", is_fgbio, to_dict_from_table)
+register_parser("tabular", lambda lines: True, to_dict_from_table)
+
+def read_prefix(line_iter, max_bytes=SniffBytes):
+    """ Reads lines from the iterator until at least max_bytes have been read, returning the lines. """
+    prefix    = []
+    num_bytes = 0
     for line in line_iter:
-        if "## METRICS CLASS" in line:
+        prefix.append(line)
+        num_bytes += len(line) + 1
+        if num_bytes >= max_bytes:
             break
-    return to_dict_from_table(path, line_iter, category)
+    return prefix
 
-def to_metric_dict(path, category=None):
+def sniff_parser(prefix):
+    """ Returns the first parser that accepts the lines in the prefix of a metric file. """
+    return next(parser for parser in MetricParsers.values() if parser.sniff(prefix))
+
+def sniff_metric_file(path):
+    """
+    Classifies the metric file from its first SniffBytes bytes, returning the parser
+    and the lines read, or (None, []) if the file is empty.
+    """
+    with open_metric_file(path) as fh:
+        prefix = read_prefix(line.rstrip("\r\n") for line in fh)
+    return (sniff_parser(prefix) if prefix else None), prefix
+
+def to_metric_dict(path, category=None, column_types=None, columns=None, category_values=None):
     """
     Produces a dictionary of metrics and values, with one key per
     metric category (or "None" if no category exists).  The value per category
     is a map from metric name to value.  All metric names will be changed to
-    lowercase.
+    lowercase.  The parser is chosen from the registered parsers by the first
+    SniffBytes bytes of the file.  The file is streamed and read only up to the end
+    of the metrics table (or of the first SniffBytes bytes), so any trailing
+    sections (ex. histograms) are not read.  See to_dict_from_table for the column
+    types, columns, and category values.
     """
-    with open(path, "r") as fh:
-        lines = [line.rstrip("\r\n") for line in fh]
-        if len(lines) == 0:
+    data, _ = to_metric_dict_and_bytes_read(path, category, column_types, columns, category_values)
+    return data
+
+def to_metric_dict_and_bytes_read(path, category=None, column_types=None, columns=None, category_values=None):
+    """
+    Produces the dictionary of metrics and values as in to_metric_dict, along with
+    the number of bytes read from the file.
+    """
+    with open_metric_file(path) as fh:
+        line_iter = (line.rstrip("\r\n") for line in fh)
+        prefix    = read_prefix(line_iter)
+        if not prefix:
             warn(f"empty metric file: {path}")
-            return OrderedDict()
-        elif lines[0] == "## htsjdk.samtools.metrics.StringHeader":
-            sys.stderr.write(f"Found Picard metric file: {path}\n")
-            return to_dict_from_picard(path, lines, category)
+            data = OrderedDict()
         else:
-            # assume just a table
-            sys.stderr.write(f"Found tabular metric file: {path}\n")
-            return to_dict_from_table(path, lines, category)
+            parser = sniff_parser(prefix)
+            debug(f"Found {parser.name} metric file: {path}")
+            data = parser.parse(path, itertools.chain(prefix, line_iter), category, column_types, columns, category_values)
+        return data, fh.buffer.tell()
+
+def to_metric_dict_with_stats(path, category=None, column_types=None, columns=None, category_values=None):
+    """
+    Produces the dictionary of metrics and values as in to_metric_dict, along with
+    the time in seconds taken to parse the file and the number of bytes read.
+    """
+    start = time.perf_counter()
+    data, num_bytes = to_metric_dict_and_bytes_read(path, category, column_types, columns, category_values)
+    return data, time.perf_counter() - start, num_bytes
+
+def init_worker(error_if_warning, verbosity):
+    """ Initializes a worker process with the settings of the main process. """
+    set_error_if_warning(error_if_warning)
+    set_verbosity(verbosity)
+
+def parse_metric_files(jobs, threads=1, processes=None, func=to_metric_dict):
+    """
+    Parses the metric files for the given jobs, returning the parsed results in the
+    same order as the jobs.  Each job is a tuple of arguments to the parsing function,
+    by default (path, categories, column types) to to_metric_dict.  The files are
+    parsed concurrently in a pool of processes if given, or a pool of threads if more
+    than one thread is given, otherwise serially.  Metric files in an archive are
+    parsed in the order they are stored in the archive.
+    """
+    keys  = [archive_order(job[0]) for job in jobs]
+    order = sorted(range(len(jobs)), key=lambda i: keys[i])
+    if threads > 1 and any(open_archive(path).sequential for path in set(key[0] for key in keys) if path):
+        threads = 1 # threads would read the members of a compressed tar archive out of order
+    if processes or threads > 1:
+        import concurrent.futures
+    if processes:
+        executor  = concurrent.futures.ProcessPoolExecutor(max_workers=processes,
+                initializer=init_worker, initargs=(__ErrorIfWarning, get_verbosity()))
+        chunksize = max(1, len(jobs) // (4 * processes))
+    elif threads > 1:
+        executor  = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        chunksize = 1
+    else:
+        executor  = None
+    if executor is None:
+        parsed = [func(*jobs[i]) for i in order]
+    else:
+        with executor:
+            parsed = list(executor.map(func, *zip(*[jobs[i] for i in order]), chunksize=chunksize)) if jobs else []
+    results = [None] * len(jobs)
+    for i, result in zip(order, parsed):
+        results[i] = result
+    return results
+
+__TransformModules = dict()
+def load_transform_module(path):
+    """
+    Loads the python script used to transform metric values, loading each script
+    only once.
+    """
+    global __TransformModules
+    key = os.path.abspath(path)
+    if key not in __TransformModules:
+        spec   = importlib.util.spec_from_file_location("custom_transform", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        __TransformModules[key] = module
+    return __TransformModules[key]
 
 class MetricsDef(object):
 
-    def __init__(self, name, file_extension, doc, categories, transform_script=None):
+    def __init__(self, name, file_extension, doc, categories, transform_script=None, column_types=None):
         """
         1. The unique name of the metric (ex. "Alignment Summary Metrics").
         2. The file extension for the metric (ex. ".alignment_summary_metrics.txt")
@@ -255,6 +663,8 @@ class MetricsDef(object):
              - value: gets the metric value
            If the script is not found at the given path, we attempt to find it in the same
            directory as the metrics definition file.
+        6. A map from metric name to type ("int", "float", or "str") for metrics whose
+           type should not be inferred.
         """
         if "," in doc:
             raise Exception(f"Metric '{name}' cannot have commas in its documentation: '{doc}'")
@@ -262,71 +672,276 @@ class MetricsDef(object):
         self.file_extension   = file_extension
         self.doc              = doc
         self.categories       = categories
-        if transform_script:
-            name   = "custom_transform"
-            spec   = importlib.util.spec_from_file_location(name, transform_script)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            self.transform_func = module.transform
+        self.explicit_types   = OrderedDict(column_types or [])
+        self.column_types     = None
+        for column_type in self.explicit_types.values():
+            if column_type not in ColumnConverters:
+                raise Exception(f"Metric '{name}' has an unknown type '{column_type}', expected one of: {', '.join(ColumnConverters.keys())}")
+        self.transform_script     = transform_script or None
+        self.transform_loaded     = False
+        self.transform_func       = None
+        self.transform_batch_func = None
+        self.batch_as_numpy       = False
+
+    def load_transform(self):
+        """
+        Loads the transform script, if any, the first time it is used, so that the
+        scripts for metric groups without metric files are never loaded.
+        """
+        if self.transform_loaded or not self.transform_script:
+            return
+        module = load_transform_module(self.transform_script)
+        self.transform_func       = getattr(module, "transform", None)
+        self.transform_batch_func = getattr(module, "transform_batch", None)
+        if not self.transform_func and not self.transform_batch_func:
+            raise Exception(f"Metric '{self.name}' transform script has neither a 'transform' nor a 'transform_batch' method: {self.transform_script}")
+        if getattr(module, "BATCH_AS_NUMPY", False):
+            try:
+                import numpy
+                self.batch_as_numpy = True
+            except ImportError:
+                pass
+        self.transform_loaded = True
+
+    def infer_column_types(self, path, columns=None, stats=None):
+        """
+        Infers the type of each metric from the given metric file, and caches it to
+        parse all subsequent metric files for this definition.  Explicitly given
+        types take precedence over inferred types.  Metrics whose type is unknown (see
+        infer_column_type) have the type of each value guessed.  If columns is given,
+        only the types of those metrics (and the category columns) are inferred.
+        Returns the metrics parsed from the file as strings, so that they may be
+        converted with convert_metric_dict rather than parsing the file again.  The
+        types are not cached if the file cannot be parsed or is empty, so that they
+        are inferred from the next metric file.  If stats are given, the time taken to
+        parse the file and the number of bytes read are recorded.
+        """
+        if stats is not None and stats.enabled:
+            data, seconds, num_bytes = to_metric_dict_with_stats(path, self.categories, column_types="str", columns=columns)
+            stats.add_file(path, seconds, num_bytes)
         else:
-            self.transform_func = None 
+            data = to_metric_dict(path, self.categories, column_types="str", columns=columns)
+        if not data:
+            return data
+        column_types = OrderedDict()
+        for category_data in data.values():
+            for name, value in category_data.items():
+                column_types.setdefault(name, []).append(value)
+        column_types = OrderedDict((name, infer_column_type(name, values)) for name, values in column_types.items())
+        self.column_types = OrderedDict((name, column_type) for name, column_type in column_types.items() if column_type is not None)
+        self.column_types.update(self.explicit_types)
+        return data
+
+    @property
+    def cache_key(self):
+        """ A hash of how metric files are parsed for this definition. """
+        from bfx_qc_reporter.util.cache import ParseCache
+        return ParseCache.definition_hash(self.categories, self.column_types)
+
+    def has_transform(self):
+        """ True if the metric values should be transformed. """
+        return self.transform_script is not None
 
     def transform(self, group, category, name, value):
         """
         Transforms the metric value using the supplied transform method.
         """
+        self.load_transform()
         if self.transform_func:
             return self.transform_func(group, category, name, value)
+        elif self.transform_batch_func:
+            return self.transform_values(group, category, name, [value])[0]
         else:
             return value
 
-def main(parser, args):
+    def transform_values(self, group, category, name, values):
+        """
+        Transforms the values of a single metric across samples, using the supplied
+        batch transform method if present, otherwise the per-value transform method.
+        """
+        self.load_transform()
+        if self.transform_batch_func:
+            if self.batch_as_numpy:
+                import numpy
+                values = numpy.asarray(values)
+            values = self.transform_batch_func(group, category, name, values)
+            return values.tolist() if self.batch_as_numpy and hasattr(values, "tolist") else list(values)
+        elif self.transform_func:
+            return [self.transform_func(group, category, name, value) for value in values]
+        else:
+            return values
 
-    if not os.path.isdir(args.output_dir):
-        fail(f"--output was not a directory: '{args.output_dir}'")
+# The file extension of a compiled bundle of metric definitions (see compile-defs)
+DefsBundleExtension = ".json"
+DefsBundleVersion   = 1
 
-    __ErrorIfWarning = args.error_when_missing
-    
-    # Read in the metric defintions to print
-    with open(args.metric_defs, "r") as fh:
+def read_metric_defs(path):
+    """
+    Reads the metric definitions, returning an ordered map from metric group name to
+    definition.  The path may also be a bundle written by write_defs_bundle.
+    """
+    if path.endswith(DefsBundleExtension):
+        return read_defs_bundle(path)
+    with open(path, "r") as fh:
         metrics_defs = OrderedDict()
         for line_index, line in enumerate(fh):
             tokens = line.rstrip("\r\n").split(",")
-            if len(tokens) != 4 and len(tokens) != 5:
+            if len(tokens) < 4 or len(tokens) > 6:
                 line = line.rstrip("\r\n")
-                fail(f"Expected four or five values on line #{line_index+1}, found {len(tokens)}: '{line}'")
+                fail(f"Expected four to six values on line #{line_index+1}, found {len(tokens)}: '{line}'")
             name               = tokens[0]
             file_extension     = tokens[1]
             doc                = tokens[2]
             categories         = tokens[3].lower().split(":") if tokens[3] else None
-            transform_script   = tokens[4] if len(tokens) == 5 else None
+            transform_script   = tokens[4] if len(tokens) >= 5 else None
+            column_types       = [tuple(t.lower().split("=", 1)) for t in tokens[5].split(":") if t] if len(tokens) == 6 else None
+            if column_types and any(len(t) != 2 for t in column_types):
+                fail(f"Expected types of the form <metric-name>=<type> on line #{line_index+1}: '{tokens[5]}'")
             if name in metrics_defs:
                 fail(f"Metric '{name}' already defined on line #{line_index+1}")
             if transform_script and not os.path.exists(transform_script):
-                transform_script = os.path.join(os.path.dirname(args.metric_defs), transform_script)
-            metrics_defs[name] = MetricsDef(name=name, file_extension=file_extension, doc=doc, categories=categories, transform_script=transform_script)
+                transform_script = os.path.join(os.path.dirname(path), transform_script)
+            metrics_defs[name] = MetricsDef(name=name, file_extension=file_extension, doc=doc, categories=categories, transform_script=transform_script, column_types=column_types)
+    return metrics_defs
 
-    # Get the list of sample names
+def write_defs_bundle(path, metrics_defs, source=None):
+    """
+    Writes the metric definitions to a bundle, with the transform scripts resolved to
+    absolute paths and the metric types of each definition (if known), so that they
+    are read back quickly with read_defs_bundle.
+    """
+    metrics = []
+    for metrics_def in metrics_defs.values():
+        metrics.append(OrderedDict([
+            ("name", metrics_def.name),
+            ("file_extension", metrics_def.file_extension),
+            ("doc", metrics_def.doc),
+            ("categories", metrics_def.categories),
+            ("transform_script", os.path.abspath(metrics_def.transform_script) if metrics_def.transform_script else None),
+            ("explicit_types", list(metrics_def.explicit_types.items())),
+            ("column_types", list(metrics_def.column_types.items()) if metrics_def.column_types is not None else None),
+        ]))
+    bundle = OrderedDict([
+        ("version", DefsBundleVersion),
+        ("source", os.path.abspath(source) if source else None),
+        ("metrics", metrics),
+    ])
+    with open(path, "w") as fh:
+        fh.write(json.dumps(bundle, indent=4) + "\n")
+
+def read_defs_bundle(path):
+    """
+    Reads the metric definitions from a bundle written by write_defs_bundle,
+    returning an ordered map from metric group name to definition.  The bundle is
+    trusted to have been validated when compiled, and the transform scripts are only
+    loaded when first used.
+    """
+    with open(path, "r") as fh:
+        bundle = json.load(fh)
+    if bundle.get("version") != DefsBundleVersion:
+        fail(f"Expected a metric definitions bundle of version {DefsBundleVersion}, found {bundle.get('version')}; re-run compile-defs: {path}")
+    metrics_defs = OrderedDict()
+    for metric in bundle["metrics"]:
+        metrics_def = MetricsDef(name=metric["name"], file_extension=metric["file_extension"], doc=metric["doc"],
+                categories=metric["categories"], transform_script=metric["transform_script"],
+                column_types=[tuple(t) for t in metric["explicit_types"]])
+        if metric["column_types"] is not None:
+            metrics_def.column_types = OrderedDict(tuple(t) for t in metric["column_types"])
+        metrics_defs[metrics_def.name] = metrics_def
+    return metrics_defs
+
+def parse_shard(parser, shard):
+    """ Parses a shard of the form "<i>/<N>", returning the 1-based shard index and number of shards. """
+    try:
+        shard_index, num_shards = [int(value) for value in shard.split("/")]
+    except ValueError:
+        fail_parser(parser, f"--shard must be of the form <i>/<N>, found: '{shard}'")
+    if num_shards < 1 or shard_index < 1 or shard_index > num_shards:
+        fail_parser(parser, f"--shard must have 1 <= <i> <= <N>, found: '{shard}'")
+    return shard_index, num_shards
+
+def shard_sample_names(sample_names, shard_index, num_shards):
+    """ Returns the samples in the given 1-based shard: every N-th sample, starting at the i-th. """
+    return sample_names[shard_index-1::num_shards]
+
+def write_shard_manifest(output_prefix, shard_index, num_shards, sample_names, data_path):
+    """
+    Writes the manifest for a shard to <output-prefix>.shard.json, with the shard
+    index, the number of shards, all sample names in order, and the path to the
+    shard's metric data.
+    """
+    manifest = OrderedDict([
+        ("shard", shard_index),
+        ("num_shards", num_shards),
+        ("sample_names", sample_names),
+        ("data", os.path.basename(data_path)),
+    ])
+    with open(output_prefix + ".shard.json", "w") as fh:
+        fh.write(json.dumps(manifest, indent=4) + "\n")
+
+def csv_header(sample_names):
+    """ The header line of the flattened CSV output. """
+    return csv_row(["Group", "Category", "Name"] + sample_names + ["File Extension", "Documentation URL"]) + "\n"
+
+def csv_line(metrics_def, category, metric_name, values):
+    """
+    One line of the flattened CSV output, for a metric's values across samples.
+    Values with a comma, quote, or newline are quoted.
+    """
+    metric_values = ["Missing" if value is Missing else value for value in values]
+    items = [metrics_def.name, category, metric_name] + metric_values + [metrics_def.name]
+    items = items + [metrics_def.doc]
+    return csv_row(items) + "\n"
+
+def transform_metric_data(metric_data, metrics_defs):
+    """
+    Transforms the values in the metric matrix in place, one metric across all
+    samples at a time, for the metric definitions with a transform script.
+    """
+    for (metric_group_name, category, metric_name), values in metric_data.rows():
+        metrics_def = metrics_defs[metric_group_name]
+        if not metrics_def.has_transform():
+            continue
+        indices = [i for i, value in enumerate(values) if value is not Missing]
+        transformed = metrics_def.transform_values(metric_group_name, category, metric_name, [values[i] for i in indices])
+        for i, value in zip(indices, transformed):
+            values[i] = value
+
+def infer_metric_types(metrics_defs, file_index, sample_names, stats=None):
+    """
+    Infers the type of each metric from the first non-empty metric file found
+    across the samples for each definition, for definitions whose types are not yet
+    known.  Returns a map from the path of each metric file read to its metrics
+    parsed as strings (see MetricsDef.infer_column_types).  If stats are given, each
+    metric file read is recorded.
+    """
+    inferred = OrderedDict()
+    for metrics_def in metrics_defs.values():
+        if metrics_def.column_types is None:
+            for sample_name in sample_names:
+                path = file_index.path(sample_name, metrics_def.file_extension)
+                if file_index.find(path) is not None:
+                    inferred[path] = metrics_def.infer_column_types(path, stats=stats)
+                    if metrics_def.column_types is not None:
+                        break
+    return inferred
+
+def find_sample_names(parser, args, metrics_defs, file_index):
+    """
+    Returns the sample names given with --sample-names, inferred from the
+    --demux-barcode-metrics, or otherwise found in the output directory from the
+    metric files for the first metric definition.
+    """
     if args.demux_barcode_metrics and args.sample_names:
         fail_parser(parser, "Both --demux-barcode-metrics and --sample-prefix cannot be given.")
     elif not args.demux_barcode_metrics and not args.sample_names:
+        metric_ext   = next(iter([m.file_extension for m in metrics_defs.values()]))
         sample_names = []
-        metric_ext = next(iter([m.file_extension for m in metrics_defs.values()]))
-        def add_sample_name_from_dir(dirname):
-            for fn in os.listdir(dirname):
-                path = os.path.join(dirname, fn)
-                if os.path.isfile(path) and path.endswith(metric_ext):
-                    sample_name = fn[:len(fn)-len(metric_ext)]
-                    if args.with_sample_directories and sample_name != os.path.basename(dirname):
-                        fail(f"Sample directory {os.path.basename(dirname)} did not match sample name {sample_name} from file.\n\tmetric file: {path}\n\tsample directory: {dirname}")
-                    sample_names.append(fn[:len(fn)-len(metric_ext)])
-        if args.with_sample_directories:
-            for dirname in os.listdir(args.output_dir):
-                dirname = os.path.join(args.output_dir, dirname)
-                if os.path.isdir(dirname):
-                    add_sample_name_from_dir(dirname)
-        else:
-            add_sample_name_from_dir(args.output_dir)
+        for sample_name, dirname in file_index.sample_directories(metric_ext):
+            if args.with_sample_directories and sample_name != os.path.basename(dirname):
+                path = os.path.join(dirname, sample_name + metric_ext)
+                fail(f"Sample directory {os.path.basename(dirname)} did not match sample name {sample_name} from file.\n\tmetric file: {path}\n\tsample directory: {dirname}")
+            sample_names.append(sample_name)
         if not sample_names: fail_parser(parser, f"No samples were found in the output directory: {args.output_dir}")
     elif args.demux_barcode_metrics:
         sample_names = to_sample_names(args.demux_barcode_metrics)
@@ -334,57 +949,139 @@ def main(parser, args):
     else:
         sample_names = args.sample_names
         if not sample_names: fail_parser(parser, "No samples were specified with --sample-prefix")
+    return sample_names
+
+def main(parser, args):
+
+    if not os.path.isdir(args.output_dir) and not is_archive(args.output_dir):
+        fail(f"--output was not a directory or archive: '{args.output_dir}'")
+
+    from bfx_qc_reporter.util.stats import Stats
+    from bfx_qc_reporter.util.cache import ParseCache
+    from bfx_qc_reporter.util.histogram import to_histogram, HistogramWriter
+    from bfx_qc_reporter.util.store import write_store
+    from bfx_qc_reporter.util.viewer import write_viewer_shards
 
-    # Group the metrics by sample, metric group, category, and metric/value
-    metric_data = OrderedDict()
+    set_error_if_warning(args.error_when_missing)
+    set_verbosity(args.verbose)
+    stats = Stats(enabled=args.stats is not None, trace_memory=args.trace_memory, profile_path=args.profile)
+    
+    # Read in the metric defintions to print
+    stats.start_phase("definition loading")
+    metrics_defs = read_metric_defs(args.metric_defs)
+
+    # Index the metric files in the output directory with a single scan
+    stats.start_phase("discovery")
+    file_index = MetricFileIndex(output_dir=args.output_dir,
+            extensions=[m.file_extension for m in metrics_defs.values()],
+            with_sample_directories=args.with_sample_directories)
+
+    # Get the list of sample names
+    sample_names = find_sample_names(parser, args, metrics_defs, file_index)
+
+    # Infer the type of each metric from the first non-empty metric file for each definition
+    # across all samples, so that every shard infers the same types
+    stats.start_phase("parsing")
+    inferred = infer_metric_types(metrics_defs, file_index, sample_names, stats=stats)
+
+    # Maybe keep only the samples in this shard
+    all_sample_names = sample_names
+    if args.shard:
+        shard_index, num_shards = parse_shard(parser, args.shard)
+        sample_names = shard_sample_names(all_sample_names, shard_index, num_shards)
+
+    # Find the metric file for each sample and metric definition
+    paths = OrderedDict()
     for sample_name in sample_names: # for each sample
-        assert not sample_name in metric_data
-        sample_data = OrderedDict()
         for metric_group_name, metrics_def in metrics_defs.items(): # for each metric definition
-            assert not metric_group_name in sample_data
-            sample_dir = os.path.join(args.output_dir, sample_name) if args.with_sample_directories else args.output_dir
-            path = os.path.join(sample_dir, sample_name + metrics_def.file_extension)
-            if os.path.isfile(path):
-                # get the metrics for the given sample and metric definition
-                sample_data[metric_group_name] = to_metric_dict(path, metrics_def.categories)
-                metrics_def = metrics_defs[metric_group_name]
-                # maybe transform the values
-                if metrics_def.transform_func:
-                    assert metric_group_name in sample_data
-                    for category, sample_category_dict in sample_data[metric_group_name].items():
-                        for metric_name , sample_name_dict in sample_category_dict.items():
-                            value = sample_data[metric_group_name][category][metric_name] 
-                            value = metrics_def.transform(metric_group_name, category, metric_group_name, value)
-                            sample_data[metric_group_name][category][metric_name] = value
-            else:
-                warn(f"path does not exists for {metric_group_name}: {path}")
-                sample_data[metric_group_name] = OrderedDict()
-        # store the metrics for this sample
-        metric_data[sample_name] = sample_data
-
-    # Write it to JSON
-    with open(args.output_prefix + ".json", "w") as fh:
-        sys.stderr.write(f"Writing to {fh.name}\n")
-        fh.write(json.dumps(metric_data, sort_keys=False, indent=4, separators=(',', ': ')))
+            paths[(sample_name, metric_group_name)] = file_index.path(sample_name, metrics_def.file_extension)
+
+    # Parse the metric files that exist, possibly in parallel
+    cache  = ParseCache(args.cache_dir, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
+    jobs       = []
+    parsed     = dict()
+    cache_keys = dict()
+    for (sample_name, metric_group_name), path in paths.items():
+        entry = file_index.find(path)
+        if entry is not None:
+            metrics_def = metrics_defs[metric_group_name]
+            if path in inferred: # already parsed to infer the types
+                parsed[path] = convert_metric_dict(inferred[path], metrics_def.categories, metrics_def.column_types)
+                continue
+            if cache:
+                cached = cache.get(path, metrics_def.cache_key, stat=entry.stat())
+                if cached is not None:
+                    parsed[path] = cached
+                    continue
+            jobs.append((path, metrics_def.categories, metrics_def.column_types))
+            cache_keys[path] = metrics_def.cache_key
+        else:
+            warn(f"path does not exists for {metric_group_name}: {path}")
+    if args.stats:
+        for (path, _, _), (data, seconds, num_bytes) in zip(jobs, parse_metric_files(jobs, threads=args.threads, processes=args.processes, func=to_metric_dict_with_stats)):
+            parsed[path] = data
+            stats.add_file(path, seconds, num_bytes)
+    else:
+        for (path, _, _), data in zip(jobs, parse_metric_files(jobs, threads=args.threads, processes=args.processes)):
+            parsed[path] = data
+    if cache:
+        for path, _, _ in jobs:
+            cache.put(path, cache_keys[path], parsed[path], stat=file_index.find(path).stat())
+        cache.close()
+
+    # Store the metrics in a columnar matrix of metric (group, category, and name) by sample
+    metric_data = MetricMatrix(sample_names=sample_names, groups=metrics_defs.keys())
+    for sample_name in sample_names: # for each sample
+        for metric_group_name, metrics_def in metrics_defs.items(): # for each metric definition
+            path = paths[(sample_name, metric_group_name)]
+            if path in parsed:
+                metric_data.add(sample_name, metric_group_name, parsed[path])
+
+    # Maybe collate the histograms
+    if args.histograms:
+        stats.start_phase("histograms")
+        found  = [(key, path) for key, path in paths.items() if path in parsed]
+        writer = HistogramWriter(args.output_prefix)
+        sys.stderr.write(f"Writing to {writer.fh.name}\n")
+        histograms = parse_metric_files([(path,) for _, path in found], threads=args.threads, processes=args.processes, func=to_histogram)
+        for ((sample_name, metric_group_name), _), columns in zip(found, histograms):
+            if columns is not None:
+                writer.add(sample_name, metric_group_name, columns)
+        writer.close()
+
+    # Maybe transform the values, one metric across all samples at a time
+    stats.start_phase("transform")
+    transform_metric_data(metric_data, metrics_defs)
+
+    # Write it to a metric store, or to JSON one sample at a time
+    stats.start_phase("json write")
+    if args.sqlite:
+        sys.stderr.write(f"Writing to {args.output_prefix}.sqlite\n")
+        write_store(args.output_prefix + ".sqlite", metric_data)
+    else:
+        with open(args.output_prefix + (".ndjson" if args.ndjson else ".json"), "w") as fh:
+            sys.stderr.write(f"Writing to {fh.name}\n")
+            samples = ((sample_name, metric_data.sample_dict(sample_name)) for sample_name in sample_names)
+            write_json_samples(fh, samples, ndjson=args.ndjson)
 
     # Write it to a flattened CSV
+    stats.start_phase("csv write")
     with open(args.output_prefix + ".csv", "w") as fh:
         sys.stderr.write(f"Writing to {fh.name}\n")
 
-        header = ["Group", "Category", "Name"] + sample_names + ["File Extension,Documentation URL"]
-        fh.write(",".join(header) + "\n")
-
-        for metric_group_name, metric_group_data in metric_data[sample_names[0]].items():
-            for category, metric_category_data in metric_group_data.items():
-                for metric_name in metric_category_data.keys():
-                    metrics_def = metrics_defs[metric_group_name]
-                    def lookup(sample_data):
-                        try:
-                            return sample_data[metric_group_name][category][metric_name]
-                        except KeyError:
-                            return "Missing"
-                    metric_values = [lookup(sample_data) for sample_data in metric_data.values()]
-                    items = [metric_group_name, category, metric_name] + metric_values + [metrics_defs[metric_group_name].name]
-                    items = [str(item) for item in items]
-                    items = items + [metrics_def.doc]
-                    fh.write(",".join(items) + "\n")
+        fh.write(csv_header(sample_names))
+        for (metric_group_name, category, metric_name), values in metric_data.rows():
+            fh.write(csv_line(metrics_defs[metric_group_name], category, metric_name, values))
+
+    # Maybe write the data shards for the HTML viewer
+    if args.viewer:
+        stats.start_phase("viewer write")
+        sys.stderr.write(f"Writing to {args.output_prefix}.viewer\n")
+        write_viewer_shards(args.output_prefix, sample_names, metric_data.rows())
+
+    # Write the shard manifest, used to gather the shards
+    if args.shard:
+        data_path = args.output_prefix + (".sqlite" if args.sqlite else ".ndjson" if args.ndjson else ".json")
+        write_shard_manifest(args.output_prefix, shard_index, num_shards, all_sample_names, data_path)
+
+    stats.write(args.stats, slowest=args.stats_slowest)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import argparse
+from collections import OrderedDict
+from bfx_qc_reporter.util.parser import *
+from bfx_qc_reporter.util.util import fail, set_verbosity
+from bfx_qc_reporter.util.stats import Stats
+from bfx_qc_reporter.util.matrix import MetricMatrix
+from bfx_qc_reporter.util.json_io import write_json_samples
+from bfx_qc_reporter.util.file_index import MetricFileIndex
+from bfx_qc_reporter.util.archive import is_archive
+from bfx_qc_reporter.util.thresholds import read_threshold_defs
+from bfx_qc_reporter.load_metrics import read_metric_defs, find_sample_names, parse_metric_files, to_metric_dict, \
+        to_metric_dict_with_stats, convert_metric_dict, transform_metric_data, set_error_if_warning, warn, csv_header, csv_line
+from bfx_qc_reporter.create_report import read_report_defs, write_report
+
+def add_subparser(subparsers):
+    description="""
+    Creates a summary report directly from the metric files, reading only the reported metrics.
+
+    # Loading and Reporting in One Pass
+
+    This is equivalent to running load-metrics followed by create-report, but
+    without writing and reading back the output of load-metrics.  The metric files,
+    sample names, and metric definitions are given as for load-metrics, and the
+    report definitions (and optional --thresholds) as for create-report.  The
+    report is written to <output-prefix>.csv and <output-prefix>.json as by
+    create-report.
+
+    # Reading Only the Reported Metrics
+
+    Only the metric files for the metric groups in the report definitions (or
+    thresholds) are found and opened.  Within each metric file, only the reported
+    metrics are converted, and only the reported categories are kept (all categories
+    if any report definition for the group uses '*').  If no sample names are given,
+    the samples are found from the metric files of the first metric definition, as
+    for load-metrics, though those files are not opened unless reported.  Metric
+    types are inferred from the reported metrics only.
+
+    If --metrics-output-prefix is given, all metric groups are read in full and the
+    output of load-metrics is also written to <metrics-output-prefix>.json and
+    <metrics-output-prefix>.csv.
+
+    """
+
+    parser = build_subparser(subparsers, source_file=__file__, description=description)
+
+    script_dir = os.path.abspath(os.path.dirname(__file__))
+    parser.add_argument('--output-dir', help='The path to the directory or archive containing the metric files', required=True)
+    parser.add_argument('--output-prefix', help='The path prefix for the report files', required=True)
+    parser.add_argument('--metric-defs', help="The path to the metric definitions, comma-delimited.", required=False,
+            default=os.path.join(script_dir, "resources", "metric_defs.csv"))
+    parser.add_argument('--report-defs', help="The path to the report definitions.", required=False,
+            default=os.path.join(script_dir, "resources", "report_defs.csv"))
+    parser.add_argument('--thresholds', help="The path to the QC threshold definitions.", required=False, default=None)
+    parser.add_argument('--sample-names', help="The sample name; a sample's metric file will be <output-dir>/<sample-name><file-extension>", required=False, default=[], nargs='+')
+    parser.add_argument('--demux-barcode-metrics', help="The path to the metrics file produced by fgbio's DemuxFastqs used to infer the sample prefixes.", required=False)
+    parser.add_argument('--error-when-missing', help="Exit with an error if a missing metric file is found, otherwise warn.", required=False, action='store_true', default=False)
+    parser.add_argument('--with-sample-directories', help="The sample's metric file will be <output-dir>/<sample-name>/<sample-name><file-extension>", required=False, action='store_true', default=False)
+    parser.add_argument('--metrics-output-prefix', help="Also write the output of load-metrics (all metrics) with this path prefix.", required=False, default=None)
+    parser.add_argument('--transpose', help='Transpose the rows and columns of the report.', required=False, action='store_true', default=False)
+    parser.add_argument('--viewer', help="Also write the report as data shards for the HTML viewer to the <output-prefix>.viewer directory.", required=False, action='store_true', default=False)
+    parser.add_argument('--stats', help="Write timing, per-file, and peak memory statistics as JSON to this path.", required=False, default=None)
+    parser.add_argument('--trace-memory', help="Also record the peak memory allocated by Python in the --stats output, which slows the run.", required=False, action='store_true', default=False)
+    parser.add_argument('--profile', help="Write a cProfile profile to this path.", required=False, default=None)
+    parser.add_argument('-v', '--verbose', help="Increase the verbosity; use once to list each metric file parsed.", required=False, action='count', default=0)
+    workers = parser.add_mutually_exclusive_group()
+    workers.add_argument('--threads', help="The number of threads used to parse metric files.", required=False, type=int, default=1)
+    workers.add_argument('--processes', help="The number of processes used to parse metric files.", required=False, type=int, default=None)
+    parser.set_defaults(func=main)
+
+    return parser
+
+def compile_projection(metrics_defs, keys):
+    """
+    Returns the metrics to read from the metric files for the given (group,
+    category, name) keys: an ordered map from each referenced metric group to the
+    set of metric names and the set of category values to keep (None to keep all
+    categories).  Groups without a metric definition are skipped.
+    """
+    projection = OrderedDict()
+    for group, category, name in keys:
+        if group not in metrics_defs:
+            continue
+        if group not in projection:
+            projection[group] = (set(), set())
+        columns, category_values = projection[group]
+        columns.add(name)
+        if category == '*' or category_values is None:
+            projection[group] = (columns, None)
+        else:
+            category_values.add(category)
+    return projection
+
+def load_metric_data(metrics_defs, file_index, sample_names, projection=None, threads=1, processes=None, stats=None):
+    """
+    Parses the metric files for the given samples into a metric matrix.  If a
+    projection is given (see compile_projection), only the metric files for the
+    projected groups are parsed, and only the projected metrics and categories are
+    kept.  The values are transformed as in load-metrics.
+    """
+    stats = stats or Stats()
+    if projection is not None:
+        metrics_defs = OrderedDict((group, metrics_defs[group]) for group in projection)
+    def project(group):
+        return projection[group] if projection is not None else (None, None)
+
+    # Infer the type of each metric from the first non-empty metric file for each definition
+    inferred = dict()
+    for group, metrics_def in metrics_defs.items():
+        if metrics_def.column_types is None:
+            for sample_name in sample_names:
+                path = file_index.path(sample_name, metrics_def.file_extension)
+                if file_index.find(path) is not None:
+                    inferred[path] = metrics_def.infer_column_types(path, columns=project(group)[0], stats=stats)
+                    if metrics_def.column_types is not None:
+                        break
+
+    # Parse the metric files that exist, possibly in parallel, except those already
+    # parsed to infer the types
+    jobs   = []
+    keys   = []
+    parsed = OrderedDict()
+    for sample_name in sample_names:
+        for group, metrics_def in metrics_defs.items():
+            path = file_index.path(sample_name, metrics_def.file_extension)
+            if file_index.find(path) is None:
+                warn(f"path does not exists for {group}: {path}")
+                continue
+            columns, category_values = project(group)
+            if path in inferred:
+                parsed[(sample_name, group)] = convert_metric_dict(inferred[path], metrics_def.categories, metrics_def.column_types, category_values)
+                continue
+            parsed[(sample_name, group)] = None
+            jobs.append((path, metrics_def.categories, metrics_def.column_types, columns, category_values))
+            keys.append((sample_name, group))
+    if stats.enabled:
+        results = parse_metric_files(jobs, threads=threads, processes=processes, func=to_metric_dict_with_stats)
+        for job, key, (data, seconds, num_bytes) in zip(jobs, keys, results):
+            stats.add_file(job[0], seconds, num_bytes)
+            parsed[key] = data
+    else:
+        for key, data in zip(keys, parse_metric_files(jobs, threads=threads, processes=processes, func=to_metric_dict)):
+            parsed[key] = data
+    metric_data = MetricMatrix(sample_names=sample_names, groups=metrics_defs.keys())
+    for (sample_name, group), data in parsed.items():
+        metric_data.add(sample_name, group, data)
+
+    transform_metric_data(metric_data, metrics_defs)
+    return metric_data
+
+def main(parser, args):
+
+    if not os.path.isdir(args.output_dir) and not is_archive(args.output_dir):
+        fail(f"--output was not a directory or archive: '{args.output_dir}'")
+
+    set_error_if_warning(args.error_when_missing)
+    set_verbosity(args.verbose)
+    stats = Stats(enabled=args.stats is not None, trace_memory=args.trace_memory, profile_path=args.profile)
+
+    # Read in the metric, report, and threshold definitions, and find the metrics to read
+    stats.start_phase("definition loading")
+    metrics_defs   = read_metric_defs(args.metric_defs)
+    report_defs    = read_report_defs(args.report_defs)
+    threshold_defs = read_threshold_defs(args.thresholds) if args.thresholds else []
+    keys           = [tuple(report_def[:3]) for report_def in report_defs] + [(t.group, t.category, t.name) for t in threshold_defs]
+    projection     = None if args.metrics_output_prefix else compile_projection(metrics_defs, keys)
+    if projection is not None and not projection:
+        fail(f"None of the metric groups in the report definitions are in the metric definitions: {args.report_defs}")
+    loaded_defs    = metrics_defs if projection is None else OrderedDict((group, metrics_defs[group]) for group in projection)
+
+    # Index only the metric files to be read (and those used to find the sample names),
+    # and get the sample names
+    stats.start_phase("discovery")
+    extensions = [m.file_extension for m in loaded_defs.values()] + [next(iter(metrics_defs.values())).file_extension]
+    file_index = MetricFileIndex(output_dir=args.output_dir,
+            extensions=list(OrderedDict.fromkeys(extensions)),
+            with_sample_directories=args.with_sample_directories)
+    sample_names = find_sample_names(parser, args, metrics_defs, file_index)
+
+    # Parse the metric files
+    stats.start_phase("parsing")
+    metric_data = load_metric_data(metrics_defs, file_index, sample_names, projection=projection,
+            threads=args.threads, processes=args.processes, stats=stats)
+
+    # Maybe write the output of load-metrics
+    if args.metrics_output_prefix:
+        stats.start_phase("metrics write")
+        with open(args.metrics_output_prefix + ".json", "w") as fh:
+            sys.stderr.write(f"Writing to {fh.name}\n")
+            write_json_samples(fh, ((sample_name, metric_data.sample_dict(sample_name)) for sample_name in sample_names))
+        with open(args.metrics_output_prefix + ".csv", "w") as fh:
+            sys.stderr.write(f"Writing to {fh.name}\n")
+            fh.write(csv_header(sample_names))
+            for (metric_group_name, category, metric_name), values in metric_data.rows():
+                fh.write(csv_line(metrics_defs[metric_group_name], category, metric_name, values))
+
+    # Write the report
+    write_report(metric_data, report_defs, args.output_prefix, transpose=args.transpose, stats=stats,
+            threshold_defs=threshold_defs, viewer=args.viewer)
+
+    stats.write(args.stats)
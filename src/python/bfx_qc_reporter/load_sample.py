@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import argparse
+from bfx_qc_reporter.util.parser import *
+from bfx_qc_reporter.util.util import fail, set_verbosity
+from bfx_qc_reporter.util.matrix import MetricMatrix
+from bfx_qc_reporter.util.json_io import write_json_samples
+from bfx_qc_reporter.util.archive import is_archive
+from bfx_qc_reporter.load_metrics import read_metric_defs, to_metric_dict, convert_metric_dict, transform_metric_data, set_error_if_warning, \
+        warn, csv_header, csv_line
+
+def add_subparser(subparsers):
+    description="""
+    Parses the metric files for a single sample to JSON and CSV, starting quickly.
+
+    # Loading One Sample
+
+    This is equivalent to running load-metrics with a single sample name, and writes
+    the same <output-prefix>.json and <output-prefix>.csv, but is meant to be run
+    once per sample as soon as the sample's metric files are written.  Only the
+    modules needed to parse the metric files are imported, the output directory is
+    not scanned, and only the sample's own metric files are checked for.  A
+    transform script is only loaded if the sample has metrics for its metric group.
+
+    # Compiled Metric Definitions
+
+    Use compile-defs to validate the metric definitions and transform scripts once,
+    and give the compiled bundle to --metric-defs.  If the bundle has the metric
+    types (see compile-defs --output-dir), they are used for every sample, otherwise
+    the types are inferred from the sample's own metric files.
+
+    """
+
+    parser = build_subparser(subparsers, source_file=__file__, description=description)
+
+    script_dir = os.path.abspath(os.path.dirname(__file__))
+    parser.add_argument('--output-dir', help='The path to the directory or archive containing the metric files', required=True)
+    parser.add_argument('--sample-name', help="The sample name; the sample's metric file will be <output-dir>/<sample-name><file-extension>", required=True)
+    parser.add_argument('--output-prefix', help='The path prefix for the output files', required=True)
+    parser.add_argument('--metric-defs', help="The path to the metric definitions, comma-delimited, or a bundle from compile-defs.", required=False,
+            default=os.path.join(script_dir, "resources", "metric_defs.csv"))
+    parser.add_argument('--error-when-missing', help="Exit with an error if a missing metric file is found, otherwise warn.", required=False, action='store_true', default=False)
+    parser.add_argument('--with-sample-directories', help="The sample's metric file will be <output-dir>/<sample-name>/<sample-name><file-extension>", required=False, action='store_true', default=False)
+    parser.add_argument('-v', '--verbose', help="Increase the verbosity; use once to list each metric file parsed.", required=False, action='count', default=0)
+    parser.set_defaults(func=main)
+
+    return parser
+
+def main(parser, args):
+
+    if not os.path.isdir(args.output_dir) and not is_archive(args.output_dir):
+        fail(f"--output was not a directory or archive: '{args.output_dir}'")
+
+    set_error_if_warning(args.error_when_missing)
+    set_verbosity(args.verbose)
+    metrics_defs = read_metric_defs(args.metric_defs)
+    sample_name  = args.sample_name
+    sample_dir   = os.path.join(args.output_dir, sample_name) if args.with_sample_directories else args.output_dir
+
+    # Check for only this sample's metric files, indexing the archive if given
+    if is_archive(args.output_dir):
+        from bfx_qc_reporter.util.file_index import MetricFileIndex
+        file_index = MetricFileIndex(output_dir=args.output_dir,
+                extensions=[m.file_extension for m in metrics_defs.values()],
+                with_sample_directories=args.with_sample_directories)
+        exists = lambda path: file_index.find(path) is not None
+    else:
+        exists = lambda path: os.path.isfile(path) or os.path.isfile(path + ".gz")
+
+    # Parse the metric files that exist
+    metric_data = MetricMatrix(sample_names=[sample_name], groups=metrics_defs.keys())
+    for metric_group_name, metrics_def in metrics_defs.items():
+        path = os.path.join(sample_dir, sample_name + metrics_def.file_extension)
+        if not exists(path):
+            warn(f"path does not exists for {metric_group_name}: {path}")
+            continue
+        if metrics_def.column_types is None:
+            data = convert_metric_dict(metrics_def.infer_column_types(path), metrics_def.categories, metrics_def.column_types)
+        else:
+            data = to_metric_dict(path, metrics_def.categories, metrics_def.column_types)
+        metric_data.add(sample_name, metric_group_name, data)
+
+    # Maybe transform the values
+    transform_metric_data(metric_data, metrics_defs)
+
+    # Write it to JSON and a flattened CSV
+    with open(args.output_prefix + ".json", "w") as fh:
+        sys.stderr.write(f"Writing to {fh.name}\n")
+        write_json_samples(fh, [(sample_name, metric_data.sample_dict(sample_name))])
+    with open(args.output_prefix + ".csv", "w") as fh:
+        sys.stderr.write(f"Writing to {fh.name}\n")
+        fh.write(csv_header([sample_name]))
+        for (metric_group_name, category, metric_name), values in metric_data.rows():
+            fh.write(csv_line(metrics_defs[metric_group_name], category, metric_name, values))
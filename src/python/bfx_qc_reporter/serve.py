@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import argparse
+import threading
+import http.server
+from collections import OrderedDict
+from bfx_qc_reporter.util.parser import *
+from bfx_qc_reporter.util.util import fail, debug, set_verbosity
+from bfx_qc_reporter.util.matrix import MetricMatrix, Missing
+from bfx_qc_reporter.util.json_io import sample_json, join_sample_json
+from bfx_qc_reporter.util.file_index import MetricFileIndex
+from bfx_qc_reporter.util.archive import is_archive
+from bfx_qc_reporter.load_metrics import read_metric_defs, to_sample_names, to_metric_dict, convert_metric_dict, csv_header, csv_line, set_error_if_warning
+
+def add_subparser(subparsers):
+    description="""
+    Watches an output directory and keeps the load-metrics JSON and CSV current as metric files land.
+
+    # Watching the Output Directory
+
+    The output directory is polled every --interval seconds.  Each poll scans the
+    directory once and compares the size and modification time of each metric file
+    to the previous poll, and only new or modified metric files are parsed.  The
+    JSON and CSV output files (<output-prefix>.json and <output-prefix>.csv) are
+    rewritten after any change, re-rendering only the samples and metric groups
+    that changed.  The metric definitions, sample names, and metric file layout are
+    given as for load-metrics.  If no sample names are given, new samples are
+    discovered on each poll.
+
+    # Serving the Metrics
+
+    If --port is given, a local HTTP server serves the HTML viewer from --html-dir,
+    along with the current metrics at /metrics.json and /metrics.csv.  The viewer
+    loads the metrics automatically when served, and reloads them when they change.
+    Non-finite values (ex. NaN) are written to the JSON as strings ("NaN",
+    "Infinity", or "-Infinity") so that the viewer can parse it.
+
+    """
+
+    parser = build_subparser(subparsers, source_file=__file__, description=description)
+
+    script_dir = os.path.abspath(os.path.dirname(__file__))
+    parser.add_argument('--output-dir', help='The path to the directory or archive containing the metric files', required=True)
+    parser.add_argument('--output-prefix', help='The path prefix for the output files', required=True)
+    parser.add_argument('--metric-defs', help="The path to the metric definitions, comma-delimited.", required=False,
+            default=os.path.join(script_dir, "resources", "metric_defs.csv"))
+    parser.add_argument('--sample-names', help="The sample name; a sample's metric file will be <output-dir>/<sample-name><file-extension>", required=False, default=[], nargs='+')
+    parser.add_argument('--demux-barcode-metrics', help="The path to the metrics file produced by fgbio's DemuxFastqs used to infer the sample prefixes.", required=False)
+    parser.add_argument('--with-sample-directories', help="The sample's metric file will be <output-dir>/<sample-name>/<sample-name><file-extension>", required=False, action='store_true', default=False)
+    parser.add_argument('--interval', help="The number of seconds between polls of the output directory.", required=False, type=float, default=10.0)
+    parser.add_argument('--port', help="Serve the HTML viewer and metrics on this port of localhost.", required=False, type=int, default=None)
+    parser.add_argument('--html-dir', help="The path to the HTML viewer, by default the viewer in the source tree or installed with the package.", required=False,
+            default=default_html_dir(script_dir))
+    parser.add_argument('--once', help="Poll the output directory once, write the outputs, and exit.", required=False, action='store_true', default=False)
+    parser.add_argument('-v', '--verbose', help="Increase the verbosity; use once to list each metric file parsed.", required=False, action='count', default=0)
+    parser.set_defaults(func=main)
+
+    return parser
+
+def default_html_dir(script_dir):
+    """
+    Returns the path to the HTML viewer in the source tree (src/html) if present,
+    otherwise where it is installed (<prefix>/share/bfx-qc-reporter/html).
+    """
+    source_dir = os.path.abspath(os.path.join(script_dir, "..", "..", "html"))
+    if os.path.isdir(source_dir):
+        return source_dir
+    return os.path.join(sys.prefix, "share", "bfx-qc-reporter", "html")
+
+class IncrementalMetrics(object):
+    """
+    The metrics for a run, updated incrementally as metric files are added or
+    modified.  The JSON for each sample and the CSV lines for each metric group are
+    cached, and only re-rendered when the sample or group changes.
+    """
+
+    def __init__(self, metrics_defs, output_dir, with_sample_directories=False, sample_names=None):
+        self.metrics_defs            = metrics_defs
+        self.output_dir              = output_dir
+        self.with_sample_directories = with_sample_directories
+        self.fixed_sample_names      = sample_names
+        self.metric_data             = MetricMatrix(sample_names=[], groups=metrics_defs.keys())
+        self.signatures              = dict() # path -> (size, mtime) of the parsed metric file
+        self.sample_json             = OrderedDict() # sample name -> JSON
+        self.group_csv               = OrderedDict() # metric group -> CSV lines
+        self.dirty_samples           = set()
+        self.dirty_groups            = set(metrics_defs.keys())
+        self.version                 = 0
+        self.json                    = "{}"
+        self.csv                     = ""
+        self.lock                    = threading.Lock()
+
+    def sample_names(self, file_index):
+        """ Returns the sample names, either as given or discovered from the first metric file extension. """
+        if self.fixed_sample_names:
+            return self.fixed_sample_names
+        metric_ext = next(iter(self.metrics_defs.values())).file_extension
+        return [sample_name for sample_name, dirname in file_index.sample_directories(metric_ext)
+                if not self.with_sample_directories or sample_name == os.path.basename(dirname)]
+
+    def refresh(self):
+        """ Scans the output directory and parses new or modified metric files, returning the number parsed. """
+        file_index = MetricFileIndex(output_dir=self.output_dir,
+                extensions=[m.file_extension for m in self.metrics_defs.values()],
+                with_sample_directories=self.with_sample_directories)
+        num_changed = 0
+        for sample_name in self.sample_names(file_index):
+            if sample_name not in self.metric_data.sample_index:
+                self.metric_data.add_sample(sample_name)
+                self.dirty_samples.add(sample_name)
+                self.dirty_groups.update(self.metrics_defs.keys()) # every CSV line has a new column
+            for metric_group_name, metrics_def in self.metrics_defs.items():
+                path      = file_index.path(sample_name, metrics_def.file_extension)
+                entry     = file_index.find(path)
+                signature = None
+                if entry is not None:
+                    stat      = entry.stat()
+                    signature = (stat.st_size, stat.st_mtime_ns)
+                if signature == self.signatures.get(path):
+                    continue
+                try:
+                    self.update(sample_name, metric_group_name, path if entry is not None else None)
+                except Exception as e: # ex. a metric file that is still being written
+                    sys.stderr.write(f"Could not parse {path}, will retry on the next poll: {e!r}\n")
+                    continue
+                self.signatures[path] = signature
+                num_changed += 1
+        return num_changed
+
+    def update(self, sample_name, metric_group_name, path):
+        """
+        Replaces the metrics for the sample and group with those parsed from the path
+        (if not None).  If the metric file cannot be parsed, the error is raised and
+        the previous metrics are kept.  The metric types are only inferred from a
+        metric file that is parsed.
+        """
+        metrics_def = self.metrics_defs[metric_group_name]
+        group_data  = None
+        if path is not None:
+            debug(f"Parsing {path}")
+            if metrics_def.column_types is None:
+                group_data = convert_metric_dict(metrics_def.infer_column_types(path), metrics_def.categories, metrics_def.column_types)
+            else:
+                group_data = to_metric_dict(path, metrics_def.categories, metrics_def.column_types)
+            if metrics_def.has_transform():
+                for category, category_data in group_data.items():
+                    for metric_name, value in category_data.items():
+                        category_data[metric_name] = metrics_def.transform(metric_group_name, category, metric_name, value)
+        self.metric_data.clear(sample_name, metric_group_name)
+        if group_data is not None:
+            self.metric_data.add(sample_name, metric_group_name, group_data)
+        self.dirty_samples.add(sample_name)
+        self.dirty_groups.add(metric_group_name)
+
+    def render(self):
+        """ Re-renders the JSON and CSV for the samples and groups that changed since the last render. """
+        for sample_name in self.dirty_samples:
+            self.sample_json[sample_name] = sample_json(sample_name, self.metric_data.sample_dict(sample_name), finite=True)
+        for metric_group_name in self.dirty_groups:
+            metrics_def = self.metrics_defs[metric_group_name]
+            self.group_csv[metric_group_name] = "".join(csv_line(metrics_def, category, metric_name, values)
+                    for (category, metric_name), values in self.metric_data.group_rows(metric_group_name))
+        self.dirty_samples.clear()
+        self.dirty_groups.clear()
+        sample_names = self.metric_data.sample_names
+        with self.lock:
+            self.json     = join_sample_json([self.sample_json[sample_name] for sample_name in sample_names])
+            self.csv      = csv_header(sample_names) + "".join(self.group_csv[group] for group in self.metrics_defs.keys())
+            self.version += 1
+
+    def write(self, output_prefix):
+        """ Writes the JSON and CSV outputs, replacing any previous outputs atomically. """
+        for ext, text in [(".json", self.json), (".csv", self.csv)]:
+            path = output_prefix + ext
+            with open(path + ".tmp", "w") as fh:
+                fh.write(text)
+            os.replace(path + ".tmp", path)
+
+def make_handler(metrics, html_dir):
+    """ Returns a request handler that serves the current metrics and the HTML viewer. """
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=html_dir, **kwargs)
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            with metrics.lock:
+                content = {"/metrics.json": (metrics.json, "application/json"),
+                           "/metrics.csv": (metrics.csv, "text/csv"),
+                           "/metrics.version": (str(metrics.version), "text/plain")}.get(path)
+            if content is None:
+                return super().do_GET()
+            body = content[0].encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content[1])
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            debug("HTTP: " + (format % args), level=2)
+    return Handler
+
+def main(parser, args):
+
+    if not os.path.isdir(args.output_dir) and not is_archive(args.output_dir):
+        fail(f"--output was not a directory or archive: '{args.output_dir}'")
+    if args.demux_barcode_metrics and args.sample_names:
+        fail_parser(parser, "Both --demux-barcode-metrics and --sample-names cannot be given.")
+
+    set_verbosity(args.verbose)
+    set_error_if_warning(False)
+    metrics_defs = read_metric_defs(args.metric_defs)
+    sample_names = to_sample_names(args.demux_barcode_metrics) if args.demux_barcode_metrics else args.sample_names
+    metrics      = IncrementalMetrics(metrics_defs=metrics_defs, output_dir=args.output_dir,
+            with_sample_directories=args.with_sample_directories, sample_names=sample_names)
+
+    if args.port is not None and not args.once:
+        if not os.path.isfile(os.path.join(args.html_dir, "index.html")):
+            fail(f"--html-dir did not contain the HTML viewer (index.html): '{args.html_dir}'")
+        server = http.server.ThreadingHTTPServer(("localhost", args.port), make_handler(metrics, os.path.abspath(args.html_dir)))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        sys.stderr.write(f"Serving on http://localhost:{args.port}/\n")
+
+    try:
+        while True:
+            num_changed = metrics.refresh()
+            if num_changed > 0 or metrics.version == 0:
+                metrics.render()
+                metrics.write(args.output_prefix)
+                sys.stderr.write(f"Updated {num_changed} metric file(s); wrote {args.output_prefix}.json and {args.output_prefix}.csv\n")
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+import io
+import os
+import gzip
+import time
+import threading
+import contextlib
+from collections import OrderedDict, namedtuple
+
+ArchiveExtensions = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".zip")
+
+# The subset of os.stat_result used to detect changed metric files
+MemberStat = namedtuple("MemberStat", ["st_size", "st_mtime_ns"])
+
+def is_archive(path):
+    """ True if the path is a tar or zip archive, based on its extension. """
+    return path.lower().endswith(ArchiveExtensions) and os.path.isfile(path)
+
+def archive_root(path):
+    """ The archive's file name without its archive extension. """
+    name = os.path.basename(path)
+    for ext in ArchiveExtensions:
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+def top_level_directory(path, names):
+    """
+    Returns the top-level directory to strip from the names of the files in the
+    archive at the given path, or None if the files are not all in one top-level
+    directory.  A single top-level directory is kept if it looks like a per-sample
+    directory, with all the files directly within it named <directory>.<extension>,
+    unless it has the same name as the archive (ex. "run1/" in "run1.tar.gz").
+    """
+    if not names or any("/" not in name for name in names):
+        return None
+    roots = set(name.split("/", 1)[0] for name in names)
+    if len(roots) != 1:
+        return None
+    root  = roots.pop()
+    files = [name[len(root) + 1:] for name in names if name.count("/") == 1]
+    if root != archive_root(path) and files and all(name.startswith(root + ".") for name in files):
+        return None
+    return root
+
+class MetricArchive(object):
+    """
+    A tar (optionally compressed) or zip archive of metric files.  The archive is
+    read once to build an index of its members, and each member is then read on
+    demand, so that only the bytes that are read are decompressed.  Member names are
+    relative to the root of the archive, or to its top-level directory if it has a
+    single top-level directory (see top_level_directory).  The members of a
+    compressed tar archive should be read in the order they are stored (see
+    archive_order), as reading a member stored before the last member read
+    decompresses the archive again from its start.
+    """
+
+    def __init__(self, path):
+        self.path    = path
+        self.lock    = threading.Lock()
+        self.members = OrderedDict() # member name -> (TarInfo or ZipInfo, MemberStat)
+        import tarfile, zipfile # slow to import, so only imported when an archive is read
+        if path.lower().endswith(".zip"):
+            self.zip = zipfile.ZipFile(path)
+            self.tar = None
+            infos    = [(info.filename, info, MemberStat(info.file_size, int(time.mktime(info.date_time + (0, 0, -1)) * 1e9)))
+                        for info in self.zip.infolist() if not info.is_dir()]
+        else:
+            self.zip = None
+            self.tar = tarfile.open(path, "r:*")
+            infos    = [(info.name, info, MemberStat(info.size, int(info.mtime * 1e9)))
+                        for info in self.tar.getmembers() if info.isfile()]
+
+        # The members of a compressed tar archive are only read efficiently in order
+        self.sequential = path.lower().endswith((".tar.gz", ".tgz", ".tar.bz2", ".tar.xz"))
+
+        names = [name[2:] if name.startswith("./") else name for name, _, _ in infos]
+        root  = top_level_directory(path, names)
+        if root is not None:
+            names = [name[len(root) + 1:] for name in names]
+        for name, (_, info, stat) in zip(names, infos):
+            self.members[name] = (info, stat)
+
+    def names(self):
+        """ The names of the files in the archive, in the order they are stored. """
+        return list(self.members.keys())
+
+    def stat(self, name):
+        """ The size and modification time of the given member. """
+        return self.members[name][1]
+
+    def offset(self, name):
+        """ The offset at which the given member is stored in the archive, or 0 if there is no such member. """
+        info = self.members[name][0] if name in self.members else self.members.get(name + ".gz", (None,))[0]
+        if info is None:
+            return 0
+        return info.header_offset if self.zip else info.offset
+
+    def open(self, name):
+        """ Opens the given member for reading as bytes. """
+        info = self.members[name][0]
+        return self.zip.open(info) if self.zip else self.tar.extractfile(info)
+
+class ArchiveEntry(object):
+    """ A metric file in an archive, with the same attributes as os.DirEntry used by MetricFileIndex. """
+
+    def __init__(self, archive, member):
+        self.archive = archive
+        self.member  = member
+        self.name    = member.rsplit("/", 1)[-1]
+        self.path    = os.path.join(archive.path, member)
+
+    def is_file(self):
+        return True
+
+    def stat(self):
+        return self.archive.stat(self.member)
+
+__Archives = dict()
+def open_archive(path):
+    """
+    Opens the archive at the given path, reusing the member index until the archive
+    is modified.  The archive is opened again in each process (ex. worker processes
+    forked after the archive was opened), so that processes do not share the
+    position of the open file.
+    """
+    global __Archives
+    stat      = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns, os.getpid())
+    cached    = __Archives.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, MetricArchive(path))
+        __Archives[path] = cached
+    return cached[1]
+
+def split_archive_path(path):
+    """
+    Splits a path within an archive (ex. "run1.tar.gz/sample/sample.txt") into the
+    path to the archive and the name of the member.  Returns (None, None) if no
+    parent of the path is an archive.
+    """
+    head, parts = path, []
+    while True:
+        head, tail = os.path.split(head)
+        if not tail:
+            return None, None
+        parts.insert(0, tail)
+        if is_archive(head):
+            return head, "/".join(parts)
+
+def archive_order(path):
+    """
+    Returns a key to sort the paths of metric files so that the members of each
+    archive are read in the order they are stored, as reading the members of a
+    compressed tar archive out of order decompresses it again and again.  Paths not
+    in an archive sort before those in an archive, and keep their order with a
+    stable sort.
+    """
+    archive_path, member = split_archive_path(path)
+    if archive_path is None:
+        return ("", 0)
+    return (archive_path, open_archive(archive_path).offset(member))
+
+@contextlib.contextmanager
+def open_metric_file(path):
+    """
+    Opens a metric file for reading as text.  If the file does not exist, it is read
+    from <path>.gz if that exists, or from the member at the path within an archive
+    (see split_archive_path), itself possibly gzip-compressed.  The contents are
+    decompressed only as they are read.  For archives, the archive is locked while
+    the member is read.  The number of (uncompressed) bytes read so far is given by
+    fh.buffer.tell().
+    """
+    try:
+        fh = open(path, "r")
+    except (FileNotFoundError, NotADirectoryError):
+        fh = None
+    if fh is not None:
+        with fh:
+            yield fh
+        return
+
+    if os.path.isfile(path + ".gz"):
+        with gzip.open(path + ".gz", "rt") as fh:
+            yield fh
+        return
+
+    archive_path, member = split_archive_path(path)
+    if archive_path is None:
+        raise FileNotFoundError(f"No such metric file: '{path}'")
+    archive = open_archive(archive_path)
+    if member not in archive.members:
+        member = member + ".gz"
+        if member not in archive.members:
+            raise FileNotFoundError(f"No such metric file in archive '{archive_path}': '{path}'")
+    with archive.lock:
+        with archive.open(member) as raw:
+            if member.endswith(".gz"):
+                raw = gzip.GzipFile(fileobj=raw)
+            with io.TextIOWrapper(raw) as fh:
+                yield fh
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+# Bump this when the parsed representation of a metric file changes, so stale
+# cache entries are never returned.
+_CacheVersion = 1
+
+class ParseCache(object):
+    """
+    An on-disk cache of parsed metric files, stored in a single SQLite database
+    within the cache directory.  Each entry is keyed on the absolute path of the
+    metric file and a hash of the metric definition used to parse it, and is only
+    returned if the size and modification time of the file are unchanged.  When
+    closed, the least recently used entries are evicted until the total size of
+    the cached data is at most the given number of bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.conn      = sqlite3.connect(os.path.join(cache_dir, "parse_cache.sqlite"))
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT NOT NULL,
+                def_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (path, def_hash)
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    @staticmethod
+    def definition_hash(*values):
+        """ Returns a hash of the given values that define how a metric file is parsed. """
+        key = json.dumps([_CacheVersion] + list(values))
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def get(self, path, def_hash, stat=None):
+        """
+        Returns the cached metrics for the file, or None if not cached or the file has
+        changed.  The stat result for the file is used if given, otherwise the file is stat'ed.
+        """
+        stat = stat or os.stat(path)
+        row  = self.conn.execute("SELECT size, mtime_ns, data FROM entries WHERE path = ? AND def_hash = ?",
+                (os.path.abspath(path), def_hash)).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            return None
+        self.conn.execute("UPDATE entries SET last_used = ? WHERE path = ? AND def_hash = ?",
+                (time.time(), os.path.abspath(path), def_hash))
+        return json.loads(row[2], object_pairs_hook=OrderedDict)
+
+    def put(self, path, def_hash, data, stat=None):
+        """ Stores the parsed metrics for the file. """
+        stat = stat or os.stat(path)
+        self.conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), def_hash, stat.st_size, stat.st_mtime_ns, time.time(), json.dumps(data)))
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache is within its size bound. """
+        total = self.conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for path, def_hash, length in self.conn.execute("SELECT path, def_hash, LENGTH(data) FROM entries ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((path, def_hash))
+            total -= length
+        self.conn.executemany("DELETE FROM entries WHERE path = ? AND def_hash = ?", evicted)
+
+    def close(self):
+        """ Evicts entries as needed, then commits and closes the cache. """
+        self.evict()
+        self.conn.commit()
+        self.conn.close()
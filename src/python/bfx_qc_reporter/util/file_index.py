@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import os
+from collections import OrderedDict
+from bfx_qc_reporter.util.archive import is_archive, open_archive, ArchiveEntry
+
+class MetricFileIndex(object):
+    """
+    An index of the metric files in an output directory, built with a single
+    scan of the directory (and of each sub-directory when the metric files live
+    in per-sample directories).  Each file name is matched against all the metric
+    file extensions at once, by looking up each of its suffixes with the length
+    of a known extension.  All metric paths are then resolved from the index
+    without touching the filesystem again.
+
+    Metric files compressed with gzip (<sample-name><file-extension>.gz) are indexed
+    under the path without the ".gz" suffix.  If the output directory is a tar or
+    zip archive, the archive's members are indexed instead, with paths of the form
+    <archive>/<member>, and per-sample directories are directories in the archive.
+    """
+
+    def __init__(self, output_dir, extensions, with_sample_directories=False):
+        self.output_dir              = output_dir
+        self.with_sample_directories = with_sample_directories
+        self.extensions              = set(extensions)
+        self.extension_lengths       = sorted(set(len(ext) for ext in self.extensions), reverse=True)
+        # path -> os.DirEntry for every file matching an extension
+        self.entries                 = OrderedDict()
+        # extension -> list of (sample name, directory) in the order found
+        self.samples                 = OrderedDict((ext, []) for ext in extensions)
+
+        if is_archive(output_dir):
+            self._scan_archive(output_dir)
+        elif with_sample_directories:
+            with os.scandir(output_dir) as it:
+                directories = [entry.path for entry in it if entry.is_dir()]
+            for directory in directories:
+                self._scan(directory)
+        else:
+            self._scan(output_dir)
+
+    def _scan(self, directory):
+        """ Adds the metric files in the given directory to the index. """
+        with os.scandir(directory) as it:
+            for entry in it:
+                self._add(directory, entry)
+
+    def _scan_archive(self, path):
+        """ Adds the metric files in the archive to the index. """
+        archive = open_archive(path)
+        for member in archive.names():
+            parts = member.split("/")
+            if len(parts) == (2 if self.with_sample_directories else 1):
+                directory = os.path.join(path, parts[0]) if self.with_sample_directories else path
+                self._add(directory, ArchiveEntry(archive, member))
+
+    def _add(self, directory, entry):
+        """ Adds the file to the index if it matches an extension. """
+        name = entry.name
+        if name.endswith(".gz"):
+            name = name[:-3]
+        for length in self.extension_lengths:
+            ext = name[-length:]
+            if len(name) >= length and ext in self.extensions and entry.is_file():
+                path  = os.path.join(directory, name)
+                other = self.entries.get(path) # the same file with or without ".gz"
+                if other is None or other.name == entry.name:
+                    self.samples[ext].append((name[:-length], directory))
+                if other is None or entry.name == name: # an uncompressed file takes precedence
+                    self.entries[path] = entry
+
+    def sample_names(self, extension):
+        """
+        Returns the sample names for the metric files with the given extension,
+        in the order they were found.
+        """
+        return [sample_name for sample_name, _ in self.samples[extension]]
+
+    def sample_directories(self, extension):
+        """ Returns the (sample name, directory) for the metric files with the given extension. """
+        return list(self.samples[extension])
+
+    def path(self, sample_name, extension):
+        """ Returns the path at which the metric file for the sample and extension is expected. """
+        sample_dir = os.path.join(self.output_dir, sample_name) if self.with_sample_directories else self.output_dir
+        return os.path.join(sample_dir, sample_name + extension)
+
+    def find(self, path):
+        """ Returns the directory entry for the metric file at the given path, or None if it does not exist. """
+        return self.entries.get(path)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+import sys
+import json
+from array import array
+from collections import OrderedDict
+from bfx_qc_reporter.util.archive import open_metric_file
+
+def to_histogram(path):
+    """
+    Reads the "## HISTOGRAM" section of a Picard-style metric file, returning an
+    ordered dictionary from column name (lowercase) to an array of doubles, with one
+    value per histogram row.  Values that are not numbers are stored as NaN.  Returns
+    None if the file has no histogram.
+    """
+    with open_metric_file(path) as fh:
+        line_iter = (line.rstrip("\r\n") for line in fh)
+        for line in line_iter:
+            if line.startswith("## HISTOGRAM"):
+                break
+        else:
+            return None
+        header = next(line_iter, None)
+        if not header:
+            return None
+        columns = OrderedDict((name.lower(), array('d')) for name in header.split("\t"))
+        arrays  = list(columns.values())
+        for line in line_iter:
+            if not line:
+                break
+            for values, value in zip(arrays, line.split("\t")):
+                try:
+                    values.append(float(value))
+                except ValueError:
+                    values.append(float("nan"))
+        return columns
+
+class HistogramWriter(object):
+    """
+    Writes histograms to a compact binary sidecar, <prefix>.histograms.bin, with a
+    small JSON index, <prefix>.histograms.json.  Each histogram is stored as its
+    columns, one after the other, each as little-endian doubles.  The index maps
+    each sample and metric group to the byte offset of the histogram, its number of
+    rows, and its column names, so a single histogram can be read without reading
+    any others.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.fh     = open(prefix + ".histograms.bin", "wb")
+        self.index  = OrderedDict()
+        self.offset = 0
+
+    def add(self, sample_name, group, columns):
+        """ Adds the histogram (a map from column name to array of doubles) for the sample and group. """
+        length = len(next(iter(columns.values()))) if columns else 0
+        self.index.setdefault(sample_name, OrderedDict())[group] = OrderedDict([
+            ("offset", self.offset), ("length", length), ("columns", list(columns.keys()))])
+        for values in columns.values():
+            if sys.byteorder != "little":
+                values = array('d', values)
+                values.byteswap()
+            self.fh.write(values.tobytes())
+            self.offset += len(values) * values.itemsize
+
+    def close(self):
+        """ Closes the binary file and writes the index. """
+        self.fh.close()
+        with open(self.prefix + ".histograms.json", "w") as fh:
+            fh.write(json.dumps(self.index, sort_keys=False, indent=4, separators=(',', ': ')))
+
+class HistogramReader(object):
+    """ Reads individual histograms from the sidecar written by HistogramWriter. """
+
+    def __init__(self, prefix):
+        with open(prefix + ".histograms.json", "r") as fh:
+            self.index = json.load(fh, object_pairs_hook=OrderedDict)
+        self.fh = open(prefix + ".histograms.bin", "rb")
+
+    def get(self, sample_name, group):
+        """ Returns the histogram for the sample and group, or None if it does not exist. """
+        try:
+            entry = self.index[sample_name][group]
+        except KeyError:
+            return None
+        self.fh.seek(entry["offset"])
+        columns = OrderedDict()
+        for name in entry["columns"]:
+            values = array('d')
+            values.frombytes(self.fh.read(entry["length"] * values.itemsize))
+            if sys.byteorder != "little":
+                values.byteswap()
+            columns[name] = values
+        return columns
+
+    def close(self):
+        self.fh.close()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import json
+import math
+from collections import OrderedDict
+
+# The strings that replace non-finite floats in JSON read by the HTML viewer (see dumps_finite)
+NonFiniteStrings = {"nan": "NaN", "inf": "Infinity", "-inf": "-Infinity"}
+
+def finite_value(value):
+    """ Returns the value with any non-finite floats within it replaced by strings (see NonFiniteStrings). """
+    if isinstance(value, float):
+        return value if math.isfinite(value) else NonFiniteStrings[str(value)]
+    if isinstance(value, dict):
+        return OrderedDict((key, finite_value(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [finite_value(item) for item in value]
+    return value
+
+def dumps_finite(value, **kwargs):
+    """
+    Returns the value as JSON, as by json.dumps, but with non-finite floats written
+    as strings (ex. "NaN") rather than as the NaN and Infinity tokens that JSON.parse
+    rejects.
+    """
+    try:
+        return json.dumps(value, allow_nan=False, **kwargs)
+    except ValueError:
+        return json.dumps(finite_value(value), **kwargs)
+
+def write_json_samples(fh, samples, ndjson=False):
+    """
+    Writes the (sample name, sample data) pairs to the given file handle, one
+    sample at a time.  By default, writes a single pretty-printed JSON object
+    keyed by sample name, byte-for-byte identical to dumping the whole object at
+    once.  If ndjson is True, writes one JSON object per line, each with a single
+    key (the sample name) mapping to that sample's data.
+    """
+    if ndjson:
+        for sample_name, sample_data in samples:
+            fh.write(json.dumps({sample_name: sample_data}, sort_keys=False) + "\n")
+        return
+    fh.write("{")
+    separator = "\n    "
+    for sample_name, sample_data in samples:
+        fh.write(separator + sample_json(sample_name, sample_data))
+        separator = ",\n    "
+    fh.write("}" if separator == "\n    " else "\n}")
+
+def sample_json(sample_name, sample_data, finite=False):
+    """
+    Returns the pretty-printed JSON for one sample's entry in the JSON object keyed
+    by sample name, as written by write_json_samples.  If finite is True,
+    non-finite floats are written as strings (see dumps_finite).
+    """
+    dumps     = dumps_finite if finite else json.dumps
+    data_json = dumps(sample_data, sort_keys=False, indent=4, separators=(',', ': '))
+    return json.dumps(sample_name) + ": " + data_json.replace("\n", "\n    ")
+
+def join_sample_json(chunks):
+    """ Joins the JSON for each sample, from sample_json, into the JSON object keyed by sample name. """
+    return "{\n    " + ",\n    ".join(chunks) + "\n}" if chunks else "{}"
+
+def is_ndjson(path):
+    """ True if the path has a newline-delimited JSON file extension. """
+    return path.endswith(".ndjson") or path.endswith(".jsonl")
+
+def read_json_samples(path):
+    """
+    Iterates over the (sample name, sample data) pairs in the given JSON file, as
+    written by write_json_samples.  Newline-delimited JSON files (with a .ndjson
+    or .jsonl extension) are read one sample at a time, otherwise the whole file
+    is read at once.
+    """
+    with open(path, "r") as fh:
+        if is_ndjson(path):
+            for line in fh:
+                if not line.strip():
+                    continue
+                for sample_name, sample_data in json.loads(line, object_pairs_hook=OrderedDict).items():
+                    yield sample_name, sample_data
+        else:
+            for sample_name, sample_data in json.load(fh, object_pairs_hook=OrderedDict).items():
+                yield sample_name, sample_data
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import sys
+from collections import OrderedDict
+
+# The value stored for a metric that was not found for a sample.
+Missing = None
+
+class MetricMatrix(object):
+    """
+    A columnar store of metric values across samples.  Each metric is identified
+    by its (group, category, name) key, and stores one list of values with one
+    value per sample (or Missing if the sample does not have the metric).  The
+    set of metrics is the union of the metrics across all samples, ordered by
+    metric group (in the order the groups were first added), then by the order
+    in which each category and metric name was first seen.  Category and metric
+    names are interned, so they are stored only once across all samples.
+    """
+
+    def __init__(self, sample_names, groups=None):
+        self.sample_names  = list(sample_names)
+        self.sample_index  = dict((sample_name, i) for i, sample_name in enumerate(self.sample_names))
+        if len(self.sample_index) != len(self.sample_names):
+            raise Exception("Sample names must be unique")
+        # group -> category -> name -> list of values (one per sample)
+        self.groups = OrderedDict((group, OrderedDict()) for group in (groups or []))
+
+    def add_sample(self, sample_name):
+        """ Adds a new sample with all metrics missing. """
+        if sample_name in self.sample_index:
+            raise Exception(f"Sample already added: {sample_name}")
+        self.sample_index[sample_name] = len(self.sample_names)
+        self.sample_names.append(sample_name)
+        for _, values in self.rows():
+            values.append(Missing)
+
+    def add_group(self, group):
+        """ Adds the metric group if not already present. """
+        if group not in self.groups:
+            self.groups[group] = OrderedDict()
+        return self.groups[group]
+
+    def row(self, group, category, name, create=False):
+        """
+        Returns the list of values across samples for the given metric, or None
+        if the metric does not exist and create is False.
+        """
+        try:
+            return self.groups[group][category][name]
+        except KeyError:
+            if not create:
+                return None
+        categories = self.add_group(group)
+        if category not in categories:
+            categories[sys.intern(category)] = OrderedDict()
+        values = [Missing] * len(self.sample_names)
+        categories[category][sys.intern(name)] = values
+        return values
+
+    def add(self, sample_name, group, group_data):
+        """
+        Adds the metrics for a given sample and metric group, where the group
+        data is a map from category to a map of metric name to value.
+        """
+        index = self.sample_index[sample_name]
+        self.add_group(group)
+        for category, category_data in group_data.items():
+            for name, value in category_data.items():
+                self.row(group, category, name, create=True)[index] = value
+
+    def clear(self, sample_name, group):
+        """ Sets all the metrics in the given group to Missing for the given sample. """
+        index = self.sample_index[sample_name]
+        for names in self.groups.get(group, OrderedDict()).values():
+            for values in names.values():
+                values[index] = Missing
+
+    def group_rows(self, group):
+        """ Iterates over the ((category, name), values) for every metric in the group. """
+        for category, names in self.groups.get(group, OrderedDict()).items():
+            for name, values in names.items():
+                yield (category, name), values
+
+    def categories(self, group):
+        """ Returns the categories for the given metric group. """
+        return list(self.groups.get(group, OrderedDict()).keys())
+
+    def rows(self):
+        """ Iterates over the ((group, category, name), values) for every metric. """
+        for group, categories in self.groups.items():
+            for category, names in categories.items():
+                for name, values in names.items():
+                    yield (group, category, name), values
+
+    def sample_dict(self, sample_name):
+        """
+        Returns the nested group -> category -> name -> value dictionary for the
+        given sample, omitting metrics the sample does not have.
+        """
+        index       = self.sample_index[sample_name]
+        sample_data = OrderedDict()
+        for group, categories in self.groups.items():
+            group_data = OrderedDict()
+            for category, names in categories.items():
+                category_data = OrderedDict((name, values[index]) for name, values in names.items() if values[index] is not Missing)
+                if category_data:
+                    group_data[category] = category_data
+            sample_data[group] = group_data
+        return sample_data
+
+    def to_dict(self):
+        """ Returns the nested sample -> group -> category -> name -> value dictionary. """
+        return OrderedDict((sample_name, self.sample_dict(sample_name)) for sample_name in self.sample_names)
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Builds the matrix from a nested sample -> group -> category -> name -> value dictionary. """
+        return cls.from_samples(data.items())
+
+    @classmethod
+    def from_samples(cls, samples, groups=None):
+        """
+        Builds the matrix from an iterable of (sample name, sample data) pairs, where
+        the sample data is a nested group -> category -> name -> value dictionary.
+        If groups is given, only those metric groups are stored.
+        """
+        matrix = cls(sample_names=[])
+        for sample_name, sample_data in samples:
+            matrix.add_sample(sample_name)
+            for group, group_data in sample_data.items():
+                if groups is None or group in groups:
+                    matrix.add(sample_name, group, group_data)
+        return matrix
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import cProfile
+import tracemalloc
+from collections import OrderedDict
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_bytes():
+    """ The peak resident set size of this process in bytes, or None if not available. """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024 # bytes on macOS, otherwise kilobytes
+
+class Stats(object):
+    """
+    Collects per-phase wall and CPU times, per-file parse times and bytes read, the
+    peak resident set size of the process, and optionally the peak memory allocated
+    by Python (via tracemalloc) and a cProfile profile, then writes them as JSON.
+    When not enabled, phases are not timed and nothing is collected.  Tracing memory
+    slows down the run several times over, so should not be combined with timing.
+    """
+
+    def __init__(self, enabled=False, trace_memory=False, profile_path=None):
+        self.enabled      = enabled
+        self.trace_memory = enabled and trace_memory
+        self.profile_path = profile_path
+        self.phases       = OrderedDict()
+        self.files        = []
+        self.profiler     = None
+        self.current      = None
+        self.wall_start   = time.perf_counter()
+        self.cpu_start    = time.process_time()
+        if self.trace_memory:
+            tracemalloc.start()
+        if profile_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def start_phase(self, name):
+        """
+        Ends the current phase (if any) and starts timing the given phase.  Time spent
+        in a phase that is started more than once is summed.
+        """
+        self.end_phase()
+        if self.enabled:
+            self.current = (name, time.perf_counter(), time.process_time())
+
+    def end_phase(self):
+        """ Ends the current phase, if any. """
+        if self.enabled and self.current:
+            name, wall_start, cpu_start = self.current
+            wall, cpu = self.phases.get(name, (0.0, 0.0))
+            self.phases[name] = (wall + time.perf_counter() - wall_start, cpu + time.process_time() - cpu_start)
+        self.current = None
+
+    def add_file(self, path, seconds, num_bytes):
+        """ Records the time taken to parse a file, and the number of bytes read. """
+        if self.enabled:
+            self.files.append((path, seconds, num_bytes))
+
+    def write(self, path, slowest=10):
+        """ Ends the current phase, stops profiling, and writes the statistics as JSON to the given path. """
+        self.end_phase()
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+        if not self.enabled:
+            return
+        peak = None
+        rss  = peak_rss_bytes()
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        files  = sorted(self.files, key=lambda f: f[1], reverse=True)
+        output = OrderedDict([
+            ("wall_seconds", time.perf_counter() - self.wall_start),
+            ("cpu_seconds", time.process_time() - self.cpu_start),
+            ("peak_rss_bytes", rss),
+            ("peak_memory_bytes", peak),
+            ("phases", OrderedDict((name, OrderedDict([("wall_seconds", wall), ("cpu_seconds", cpu)])) for name, (wall, cpu) in self.phases.items())),
+            ("files_parsed", len(self.files)),
+            ("parse_seconds", sum(f[1] for f in self.files)),
+            ("bytes_read", sum(f[2] for f in self.files)),
+            ("slowest_files", [OrderedDict([("path", p), ("seconds", s), ("bytes_read", b)]) for p, s, b in files[:slowest]]),
+            ("files", [OrderedDict([("path", p), ("seconds", s), ("bytes_read", b)]) for p, s, b in self.files]),
+        ])
+        with open(path, "w") as fh:
+            fh.write(json.dumps(output, indent=4) + "\n")
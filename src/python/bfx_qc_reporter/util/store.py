@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+import os
+import json
+import sqlite3
+import hashlib
+from bfx_qc_reporter.util.matrix import MetricMatrix, Missing
+
+def is_store(path):
+    """ True if the path has a metric store file extension. """
+    return path.endswith(".sqlite") or path.endswith(".db")
+
+# The schema of the metric store.  The runs table, and the run of each sample, are
+# only used by a cohort store that holds the samples from many runs.
+_Schema = """
+    CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, digest TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS samples (sample_id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, run_id INTEGER);
+    CREATE INDEX IF NOT EXISTS samples_run_id ON samples (run_id);
+    CREATE TABLE IF NOT EXISTS groups (group_id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS metrics (
+        metric_id INTEGER PRIMARY KEY,
+        grp TEXT NOT NULL,
+        category TEXT NOT NULL,
+        name TEXT NOT NULL,
+        UNIQUE (grp, category, name)
+    );
+    CREATE TABLE IF NOT EXISTS metric_values (
+        metric_id INTEGER NOT NULL,
+        sample_id INTEGER NOT NULL,
+        value,
+        PRIMARY KEY (metric_id, sample_id)
+    ) WITHOUT ROWID;
+"""
+
+def open_store(path):
+    """ Opens the metric store for writing, creating it if it does not exist. """
+    conn = sqlite3.connect(path)
+    conn.executescript(_Schema)
+    return conn
+
+def write_store(path, metric_data):
+    """
+    Writes the metric matrix to a single-file SQLite metric store.  Metrics are
+    indexed by (group, category, name), and their values are stored clustered by
+    metric then sample, so that all values of one metric are read together.  The
+    values keep their types (integer, float, or string).  Missing values are not
+    stored.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = open_store(path)
+    conn.executemany("INSERT INTO samples (sample_id, name) VALUES (?, ?)", enumerate(metric_data.sample_names))
+    conn.executemany("INSERT INTO groups VALUES (?, ?)", enumerate(metric_data.groups.keys()))
+    for metric_id, ((group, category, name), values) in enumerate(metric_data.rows()):
+        conn.execute("INSERT INTO metrics VALUES (?, ?, ?, ?)", (metric_id, group, category, name))
+        conn.executemany("INSERT INTO metric_values VALUES (?, ?, ?)",
+                ((metric_id, sample_id, value) for sample_id, value in enumerate(values) if value is not Missing))
+    conn.commit()
+    conn.close()
+
+def append_run(path, run_name, samples):
+    """
+    Appends the samples from one run to a cohort store, creating the store if it
+    does not exist.  The samples are an iterable of (sample name, sample data) pairs,
+    where the sample data is a nested group -> category -> name -> value dictionary,
+    and are written one at a time.  Each sample is stored as "<run-name>/<sample-name>".
+    If a run with the same name was already added, it is replaced, unless its data is
+    identical, in which case the store is left unchanged.  Returns one of "added",
+    "replaced", or "unchanged".
+    """
+    conn     = open_store(path)
+    previous = conn.execute("SELECT run_id, digest FROM runs WHERE name = ?", (run_name,)).fetchone()
+    if previous is not None:
+        run_id = previous[0]
+        conn.execute("DELETE FROM metric_values WHERE sample_id IN (SELECT sample_id FROM samples WHERE run_id = ?)", (run_id,))
+        conn.execute("DELETE FROM samples WHERE run_id = ?", (run_id,))
+        conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+    run_id  = conn.execute("INSERT INTO runs (name, digest) VALUES (?, '')", (run_name,)).lastrowid
+    groups  = set(name for name, in conn.execute("SELECT name FROM groups"))
+    metrics = dict(((group, category, name), metric_id) for metric_id, group, category, name in conn.execute("SELECT metric_id, grp, category, name FROM metrics"))
+    digest  = hashlib.sha1()
+    for sample_name, sample_data in samples:
+        digest.update(json.dumps([sample_name, sample_data]).encode("utf-8"))
+        sample_id = conn.execute("INSERT INTO samples (name, run_id) VALUES (?, ?)", (f"{run_name}/{sample_name}", run_id)).lastrowid
+        rows      = []
+        for group, group_data in sample_data.items():
+            if group not in groups:
+                conn.execute("INSERT INTO groups (name) VALUES (?)", (group,))
+                groups.add(group)
+            for category, category_data in group_data.items():
+                for name, value in category_data.items():
+                    key = (group, category, name)
+                    if key not in metrics:
+                        metrics[key] = conn.execute("INSERT INTO metrics (grp, category, name) VALUES (?, ?, ?)", key).lastrowid
+                    if value is not Missing:
+                        rows.append((metrics[key], sample_id, value))
+        conn.executemany("INSERT INTO metric_values VALUES (?, ?, ?)", rows)
+    digest = digest.hexdigest()
+    if previous is not None and previous[1] == digest:
+        conn.rollback()
+        status = "unchanged"
+    else:
+        conn.execute("UPDATE runs SET digest = ? WHERE run_id = ?", (digest, run_id))
+        conn.commit()
+        status = "added" if previous is None else "replaced"
+    conn.close()
+    return status
+
+def read_store(path, keys=None):
+    """
+    Reads the metric store into a metric matrix.  If keys is given, only the
+    metrics with those (group, category, name) keys are read, where a category
+    of '*' matches all categories in the group.  All samples are always read.
+    """
+    conn         = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    samples      = conn.execute("SELECT sample_id, name FROM samples ORDER BY sample_id").fetchall()
+    sample_index = dict((sample_id, index) for index, (sample_id, _) in enumerate(samples))
+    metric_data  = MetricMatrix(sample_names=[name for _, name in samples])
+    if keys is None:
+        metrics = conn.execute("SELECT metric_id, grp, category, name FROM metrics ORDER BY metric_id").fetchall()
+        for group, in conn.execute("SELECT name FROM groups ORDER BY group_id"):
+            metric_data.add_group(group)
+    else:
+        metrics = set()
+        for group, category, name in keys:
+            if category == '*':
+                query = conn.execute("SELECT metric_id, grp, category, name FROM metrics WHERE grp = ? AND name = ?", (group, name))
+            else:
+                query = conn.execute("SELECT metric_id, grp, category, name FROM metrics WHERE grp = ? AND category = ? AND name = ?", (group, category, name))
+            metrics.update(query.fetchall())
+        metrics = sorted(metrics)
+    for metric_id, group, category, name in metrics:
+        values = metric_data.row(group, category, name, create=True)
+        for sample_id, value in conn.execute("SELECT sample_id, value FROM metric_values WHERE metric_id = ?", (metric_id,)):
+            values[sample_index[sample_id]] = value
+    conn.close()
+    return metric_data
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import operator
+from collections import OrderedDict
+from bfx_qc_reporter.util.matrix import Missing
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The comparison operators allowed in a threshold, longest first so that "<=" is not read as "<"
+Operators = OrderedDict([
+    ("<=", operator.le),
+    (">=", operator.ge),
+    ("==", operator.eq),
+    ("!=", operator.ne),
+    ("<", operator.lt),
+    (">", operator.gt),
+])
+
+Levels = ["warn", "fail"]
+
+class ThresholdDef(object):
+    """
+    A threshold on a metric: the metric is flagged at the given level ("warn" or
+    "fail") for each sample where the expression (ex. "< 0.9") is true for the
+    sample's value.
+    """
+
+    def __init__(self, group, category, name, level, expression):
+        self.group      = group
+        self.category   = category
+        self.name       = name
+        self.level      = level.lower()
+        self.expression = expression.strip()
+        if self.level not in Levels:
+            raise Exception(f"Threshold level must be one of {', '.join(Levels)}, found '{level}' for metric '{name}'")
+        for symbol, func in Operators.items():
+            if self.expression.startswith(symbol):
+                self.symbol, self.func = symbol, func
+                value = self.expression[len(symbol):].strip()
+                break
+        else:
+            raise Exception(f"Threshold must start with one of {' '.join(Operators.keys())}, found '{expression}' for metric '{name}'")
+        try:
+            self.value = float(value)
+        except ValueError:
+            self.value = value
+
+    def label(self):
+        """ The label for the threshold (ex. "pct_pf_reads_aligned < 0.9"). """
+        return f"{self.name} {self.symbol} {self.value if isinstance(self.value, str) else value_str(self.value)}"
+
+    def evaluate(self, values):
+        """
+        Evaluates the threshold over the values of the metric across all samples at
+        once, returning the status for each sample: "PASS", "WARN", "FAIL", or
+        "Missing" if the sample does not have the metric or the value could not be
+        compared.  A numeric threshold only compares numeric values (see is_number),
+        so strings such as "5" are "Missing".  NumPy is used when it is installed and
+        all the values are numeric or missing, with the same results.
+        """
+        status = self.level.upper()
+        if numpy is not None and not isinstance(self.value, str) and all(value is Missing or is_number(value) for value in values):
+            array   = numpy.array(values, dtype=float) # Missing becomes NaN
+            flagged = self.func(array, self.value)
+            return numpy.where(numpy.isnan(array), "Missing", numpy.where(flagged, status, "PASS")).tolist()
+        return [self._evaluate_one(value, status) for value in values]
+
+    def _evaluate_one(self, value, status):
+        """ Evaluates the threshold for a single value. """
+        if value is Missing or value != value: # NaN
+            return "Missing"
+        if not isinstance(self.value, str) and not is_number(value):
+            return "Missing"
+        try:
+            return status if self.func(value, self.value) else "PASS"
+        except TypeError:
+            return "Missing"
+
+def is_number(value):
+    """ True if the value is an integer or float (but not a boolean). """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def value_str(value):
+    """ Formats a threshold value, without a trailing ".0" for whole numbers. """
+    return str(int(value)) if value.is_integer() else str(value)
+
+def read_threshold_defs(path):
+    """
+    Reads the threshold definitions, comma-delimited, skipping comment lines.  Each
+    line has the metric group, category, metric name, level, and expression.
+    """
+    threshold_defs = []
+    with open(path, "r") as fh:
+        for line in fh:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.rstrip("\r\n").split(",")
+            if len(fields) != 5:
+                raise Exception(f"Expected 5 columns in the threshold definitions, found {len(fields)}: {line}")
+            threshold_defs.append(ThresholdDef(*fields))
+    return threshold_defs
+
+def evaluate_thresholds(metric_data, threshold_defs):
+    """
+    Evaluates the thresholds over the metric matrix, one metric across all samples at
+    a time.  Returns a list of (threshold, category, statuses) with one entry per
+    threshold and category ('*' matches all categories in the group), and the
+    overall status of each sample: "FAIL" if any threshold failed, otherwise "WARN"
+    if any threshold warned, otherwise "PASS".
+    """
+    num_samples = len(metric_data.sample_names)
+    results     = []
+    for threshold_def in threshold_defs:
+        group, category = threshold_def.group, threshold_def.category
+        categories = metric_data.categories(group) if category == '*' else [category]
+        for category in categories:
+            row = metric_data.row(group, category, threshold_def.name)
+            statuses = ["Missing"] * num_samples if row is None else threshold_def.evaluate(row)
+            results.append((threshold_def, category, statuses))
+
+    overall = ["PASS"] * num_samples
+    for level in ["WARN", "FAIL"]:
+        for _, _, statuses in results:
+            overall = [level if status == level else current for status, current in zip(statuses, overall)]
+    return results, overall
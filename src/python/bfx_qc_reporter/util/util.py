@@ -6,3 +6,31 @@ def fail(msg):
     """ Writes the message to stderr and exits with code 1. """
     sys.stderr.write(msg + "\n")
     sys.exit(1)
+
+__Verbosity = 0
+def set_verbosity(value):
+    """ Sets the verbosity level for messages written with debug. """
+    global __Verbosity
+    __Verbosity = value
+
+def get_verbosity():
+    """ Gets the verbosity level. """
+    return __Verbosity
+
+def debug(msg, level=1):
+    """ Writes the message to stderr if the verbosity is at least the given level. """
+    if __Verbosity >= level:
+        sys.stderr.write(msg + "\n")
+
+def csv_row(items):
+    """
+    Joins the items into one comma-delimited line (without a newline), quoting any
+    value with a comma, quote, or newline as the csv module would, so that it stays
+    in its column.
+    """
+    cells = [str(item) for item in items]
+    line  = ",".join(cells)
+    if line.count(",") != len(cells) - 1 or '"' in line or "\n" in line or "\r" in line:
+        cells = ['"' + cell.replace('"', '""') + '"' if any(c in cell for c in ',"\n\r') else cell for cell in cells]
+        line  = ",".join(cells)
+    return line
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import os
+from collections import OrderedDict
+from bfx_qc_reporter.util.json_io import dumps_finite
+
+# The number of samples in each data shard for the HTML viewer
+ViewerPageSize = 100
+
+def write_viewer_shards(output_prefix, sample_names, rows, page_size=ViewerPageSize):
+    """
+    Writes the metrics for the HTML viewer as small data shards to the directory
+    <output_prefix>.viewer, so that the viewer only reads the metrics it displays.
+    The rows are ((group, category, name), values) with one value per sample.  Each
+    shard holds the values of one metric group for one page of page_size samples, as
+    a list with one list of values per metric in the group.  The manifest
+    (manifest.json) has the sample names, the page size, the name and shard files
+    of each group, and one (group index, category, name) per metric, in order.
+    Non-finite floats are written as strings, as the viewer parses the shards with
+    JSON.parse.
+    Returns the path to the directory.
+    """
+    directory = output_prefix + ".viewer"
+    os.makedirs(directory, exist_ok=True)
+
+    # Collect the metrics for each group, keeping the order of the rows
+    group_indices = OrderedDict()
+    group_values  = []
+    metrics       = []
+    for (group, category, name), values in rows:
+        if group not in group_indices:
+            group_indices[group] = len(group_indices)
+            group_values.append([])
+        metrics.append([group_indices[group], category, name])
+        group_values[group_indices[group]].append(values)
+
+    # Write one shard per group and page of samples
+    num_pages = max(1, (len(sample_names) + page_size - 1) // page_size)
+    groups    = []
+    for group, group_index in group_indices.items():
+        pages = []
+        for page in range(num_pages):
+            start = page * page_size
+            shard = f"g{group_index}-p{page}.json"
+            with open(os.path.join(directory, shard), "w") as fh:
+                fh.write(dumps_finite([values[start:start + page_size] for values in group_values[group_index]]))
+            pages.append(shard)
+        groups.append(OrderedDict([("name", group), ("pages", pages)]))
+
+    manifest = OrderedDict([
+        ("sample_names", list(sample_names)),
+        ("page_size", page_size),
+        ("groups", groups),
+        ("metrics", metrics),
+    ])
+    with open(os.path.join(directory, "manifest.json"), "w") as fh:
+        fh.write(dumps_finite(manifest) + "\n")
+    return directory